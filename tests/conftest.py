@@ -0,0 +1,84 @@
+from datetime import datetime
+import http.server
+import threading
+
+import pytest
+
+from upcheck import db
+from upcheck.migrations import apply_migrations
+from upcheck.model import Config, ConnCheckRes
+from upcheck.spool import Spool
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """
+    Path of a database that does not exist yet.
+    """
+    # pooled connections of earlier tests point to other databases
+    db.close_pool()
+    yield str(tmp_path / "upcheck.db")
+    db.close_pool()
+
+
+@pytest.fixture
+def db_path(db_file):
+    """
+    Path of a new database with all migrations applied.
+    """
+    db.initialize_db(db_file)
+    with db.with_conn(db_file) as conn:
+        apply_migrations(conn)
+    return db_file
+
+
+@pytest.fixture
+def spool(tmp_path):
+    # small, so producers block quickly
+    return Spool(str(tmp_path / "spool.db"), max_pending=3)
+
+
+@pytest.fixture
+def result():
+    def make(
+        check: str = "A",
+        time: datetime = datetime(2025, 7, 1),
+        passed: bool = True,
+        duration: float | None = 0.5,
+    ) -> ConnCheckRes:
+        errors = () if passed else ("Status check failed",)
+        return ConnCheckRes(check, time, duration, 10, 200, passed, errors)
+
+    return make
+
+
+@pytest.fixture
+def config():
+    def make(**kwargs) -> Config:
+        return Config(
+            ":memory:", checks={}, domain="https://ci.test", secret="s3cr3t", **kwargs
+        )
+
+    return make
+
+
+@pytest.fixture
+def http_server():
+    """
+    Start a local http server for a request handler class, the server has its url in
+    `server.url`.
+    """
+    servers = []
+
+    def start(handler: type[http.server.BaseHTTPRequestHandler]):
+        quiet = type(handler.__name__, (handler,), {"log_message": lambda *args: None})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), quiet)
+        server.url = f"http://127.0.0.1:{server.server_port}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,133 @@
+import http.server
+import socket
+import time
+
+import pytest
+
+from upcheck import check
+from upcheck.model import ConnCheckSpec
+
+
+@pytest.mark.parametrize(
+    "kind, url, expected",
+    [
+        ("tcp", "tcp://example.com:22", ("example.com", 22)),
+        ("tcp", "example.com:22", ("example.com", 22)),
+        ("tcp", "https://example.com", ("example.com", 443)),
+        ("tls", "example.com", ("example.com", 443)),
+        ("tls", "tls://example.com:8443", ("example.com", 8443)),
+    ],
+)
+def test_host_port(kind, url, expected):
+    spec = ConnCheckSpec(name="A", type=kind, url=url)
+    assert check.host_port(spec.url, spec.type) == expected
+
+
+@pytest.mark.parametrize("url", ["tcp://example.com", "example.com", "tcp://:22"])
+def test_tcp_needs_port(url):
+    with pytest.raises(ValueError):
+        ConnCheckSpec(name="A", type="tcp", url=url)
+
+
+@pytest.fixture
+def listener():
+    sock = socket.create_server(("127.0.0.1", 0))
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def closed_port() -> int:
+    sock = socket.create_server(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_connect_tries_all_addresses(monkeypatch, listener):
+    refused = closed_port()
+    addrs = [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", refused)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", listener)),
+    ]
+    monkeypatch.setattr(socket, "getaddrinfo", lambda *args, **kwargs: addrs)
+    sock = check._connect("example.com", 80, time.monotonic() + 5)
+    assert sock.getpeername() == ("127.0.0.1", listener)
+    sock.close()
+
+    del addrs[1]
+    with pytest.raises(ConnectionRefusedError):
+        check._connect("example.com", 80, time.monotonic() + 5)
+
+
+class TruncatingHandler(http.server.BaseHTTPRequestHandler):
+    # announces more body than it sends, then closes the connection
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        self.wfile.write(b"partial")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+@pytest.mark.parametrize("range_bytes", [None, 500])
+def test_http_broken_body(http_server, config, range_bytes):
+    server = http_server(TruncatingHandler)
+    spec = ConnCheckSpec(name="A", url=server.url, range_bytes=range_bytes)
+    res, snapshot = check.check_http(config(), spec)
+    assert not res.passed
+    assert res.errors == ["Invalid Response"]
+    assert snapshot is None
+
+
+class ChunkedHandler(http.server.BaseHTTPRequestHandler):
+    # ignores Range and sends the page in small chunks, like most dynamic pages
+    protocol_version = "HTTP/1.1"
+    page = b"<html><body>" + b"x" * 40 + b"MARKER</body></html>"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(self.page), 12):
+            chunk = self.page[i : i + 12]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.mark.parametrize(
+    "range_bytes, size, passed",
+    [(None, 72, True), (4096, 72, True), (60, 60, True), (20, 20, False)],
+)
+def test_http_range_reads_across_chunks(http_server, config, range_bytes, size, passed):
+    server = http_server(ChunkedHandler)
+    spec = ConnCheckSpec(
+        name="A", url=server.url, body="MARKER", range_bytes=range_bytes
+    )
+    res, _ = check.check_http(config(), spec)
+    assert res.size == size
+    assert res.passed == passed
+
+
+class Latin1Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = "Grüße".encode("latin-1")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.mark.parametrize("range_bytes", [None, 100])
+def test_http_body_not_utf8(http_server, config, range_bytes):
+    server = http_server(Latin1Handler)
+    spec = ConnCheckSpec(name="A", url=server.url, body="Gr", range_bytes=range_bytes)
+    res, _ = check.check_http(config(), spec)
+    assert res.passed
+
+
+@pytest.mark.parametrize("range_bytes", [0, -1])
+def test_range_bytes_positive(range_bytes):
+    with pytest.raises(ValueError):
+        ConnCheckSpec(name="A", url="https://example.com", range_bytes=range_bytes)
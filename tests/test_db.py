@@ -0,0 +1,272 @@
+from datetime import datetime, timedelta
+import time
+
+import pytest
+
+from upcheck import daemon, db
+from upcheck.model import ConnCheckRes
+
+
+def save(db_path: str, *results: ConnCheckRes):
+    with db.with_conn(db_path) as conn:
+        for r in results:
+            db.save_check(conn, r)
+
+
+def test_partition_end():
+    assert db.partition_end("2025-07") == datetime(2025, 8, 1)
+    assert db.partition_end("2025-12") == datetime(2026, 1, 1)
+
+
+def test_seal_only_ended_partitions(db_path, result):
+    save(
+        db_path,
+        result(time=datetime(2025, 7, 31, 23, 59)),
+        result(time=datetime(2025, 8, 1, 0, 1)),
+    )
+    parts = db.partitions(db_path)
+
+    db.seal_partitions(datetime(2025, 7, 31, 23, 59, 59), db_path)
+    assert not db.is_sealed(parts["2025-07"])
+
+    db.seal_partitions(datetime(2025, 8, 1, 0, 0), db_path)
+    assert db.is_sealed(parts["2025-07"])
+    assert not db.is_sealed(parts["2025-08"])
+
+
+def test_late_result_reopens_sealed_partition(db_path, result):
+    save(db_path, result(time=datetime(2025, 7, 1), passed=True))
+    db.seal_partitions(datetime(2025, 8, 1), db_path)
+    with db.with_conn(db_path, rdonly=True) as conn:
+        assert db.all_time_stats(conn)["A"]["total_uptime"] == 1
+
+    save(db_path, result(time=datetime(2025, 7, 2), passed=False))
+    path = db.partitions(db_path)["2025-07"]
+    assert not db.is_sealed(path)
+    with db.with_conn(db_path, rdonly=True) as conn:
+        assert db.all_time_stats(conn)["A"]["total_uptime"] == 0.5
+
+    db.seal_partitions(datetime(2025, 8, 1), db_path)
+    assert db.is_sealed(path)
+
+
+def test_no_sealing_while_spool_has_old_results(db_path, spool, monkeypatch, result):
+    monkeypatch.setattr(
+        daemon, "seal_partitions", lambda until: db.seal_partitions(until, db_path)
+    )
+    last_month = datetime.now().replace(day=1) - timedelta(days=1)
+    save(db_path, result(time=last_month))
+    path = db.partitions(db_path)[db.partition_period(last_month)]
+
+    spool.put((result(time=last_month), None))
+    # pretend the result was spooled before the month ended
+    spool._connect().execute("UPDATE spool SET enqueued = ?", (last_month.timestamp(),))
+    daemon._seal_finished_partitions(spool, seal_delay=60)
+    assert not db.is_sealed(path)
+
+    spool.ack([id for id, _ in spool.get(10, timeout=0)])
+    daemon._seal_finished_partitions(spool, seal_delay=60)
+    assert db.is_sealed(path)
+
+
+def test_partitions_between(db_path, result):
+    for month in (6, 7, 8, 10):
+        save(db_path, result(time=datetime(2025, month, 15)))
+
+    between = db.partitions_between(
+        db_path, datetime(2025, 7, 31), datetime(2025, 10, 1)
+    )
+    assert list(between) == ["2025-07", "2025-08", "2025-10"]
+    assert list(
+        db.partitions_between(db_path, datetime(2025, 8, 2), datetime(2025, 8, 3))
+    ) == ["2025-08"]
+    assert (
+        db.partitions_between(db_path, datetime(2024, 1, 1), datetime(2025, 5, 1)) == {}
+    )
+
+
+def test_attach_evicts_oldest(db_path):
+    with db.with_conn(db_path) as conn:
+        limit = conn.getlimit(db.sqlite3.SQLITE_LIMIT_ATTACHED)
+        periods = [f"{2000 + i // 12}-{i % 12 + 1:02}" for i in range(limit + 3)]
+        for period in periods:
+            db.attach_partition(conn, period, rdonly=False)
+            attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+            # one slot stays free for VACUUM
+            assert len(attached) - 2 < limit
+        assert "p" + periods[-1].replace("-", "_") in attached
+        assert "p" + periods[0].replace("-", "_") not in attached
+    assert len(db.partitions(db_path)) == len(periods)
+
+
+def test_histogram_merges_partitions(db_path, result):
+    # one bucket from 31.07. 23:00 to 01.08. 01:00
+    save(
+        db_path,
+        result(time=datetime(2025, 7, 31, 23, 30), passed=True, duration=1),
+        result(time=datetime(2025, 8, 1, 0, 30), passed=False, duration=4),
+        result(time=datetime(2025, 8, 1, 1, 30), passed=True, duration=2),
+    )
+    end = datetime(2025, 8, 1, 3)
+    with db.with_conn(db_path, rdonly=True) as conn:
+        data = db.read_histogram_new(conn, timedelta(hours=4), end, 2)["A"]
+    assert data["hist_uptime"] == [0.5, 1]
+    assert data["hist_latency"] == pytest.approx([2, 2])
+    assert data["uptime"] == pytest.approx(2 / 3)
+    assert data["latency_geomean"] == pytest.approx(2)
+    assert data["latency_max"] == pytest.approx(4)
+
+
+def test_all_time_stats_merges_partitions(db_path, result):
+    save(
+        db_path,
+        result(time=datetime(2025, 6, 1), passed=True, duration=1),
+        result(time=datetime(2025, 7, 1), passed=False, duration=9),
+        result(time=datetime(2025, 8, 1), passed=True, duration=3),
+    )
+    db.seal_partitions(datetime(2025, 8, 1), db_path)
+    for _ in range(2):  # second round uses the cached sums of sealed partitions
+        with db.with_conn(db_path, rdonly=True) as conn:
+            stats = db.all_time_stats(conn)["A"]
+        assert stats["total_uptime"] == pytest.approx(2 / 3)
+        assert stats["total_latency_geomean"] == pytest.approx(3)
+
+
+def test_drop_partition(db_path, result):
+    save(db_path, result(time=datetime(2025, 7, 1)), result(time=datetime(2025, 8, 1)))
+    db.drop_partition("2025-07", db_path)
+    assert list(db.partitions(db_path)) == ["2025-08"]
+    with db.with_conn(db_path, rdonly=True) as conn:
+        assert db.all_time_stats(conn)["A"]["total_uptime"] == 1
+
+
+@pytest.fixture
+def berlin(monkeypatch):
+    # days in UTC and months in local time don't line up here
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize(
+    "span, level",
+    [
+        (timedelta(days=1), "raw"),
+        (timedelta(days=30), "hour"),
+        (timedelta(days=100), "day"),
+        (timedelta(days=5000), "day"),
+    ],
+)
+def test_host_detail_level(db_path, span, level):
+    end = datetime(2025, 8, 1)
+    with db.with_conn(db_path, rdonly=True) as conn:
+        data = db.read_host_detail(conn, "A", end - span, end, interval=300)
+    assert data["level"] == level
+    assert data["seconds"] == {"raw": 300, **db.ROLLUPS}[level]
+
+
+def test_host_detail_raw(db_path, result):
+    save(
+        db_path,
+        result(time=datetime(2025, 7, 31, 23, 55), passed=True, duration=0.25),
+        result(time=datetime(2025, 8, 1, 0, 0), passed=False, duration=None),
+        result(time=datetime(2025, 8, 1, 0, 5), passed=True, duration=2),
+    )
+    with db.with_conn(db_path, rdonly=True) as conn:
+        data = db.read_host_detail(
+            conn, "A", datetime(2025, 7, 31, 23), datetime(2025, 8, 1, 0, 5), 300
+        )
+    assert data["t"] == [
+        datetime(2025, 7, 31, 23, 55).timestamp(),
+        datetime(2025, 8, 1).timestamp(),
+    ]
+    assert data["uptime"] == [1000, 0]
+    assert data["latency"] == [250, None]
+    assert data["latency_max"] == [250, None]
+
+
+def test_host_detail_merges_buckets_across_months(db_path, berlin, result):
+    save(
+        db_path,
+        result(time=datetime(2025, 7, 31, 23), passed=True, duration=1),
+        result(time=datetime(2025, 8, 1, 1), passed=False, duration=4),
+        result(time=datetime(2025, 8, 10), passed=True, duration=1),
+    )
+    assert list(db.partitions(db_path)) == ["2025-07", "2025-08"]
+
+    # the first day bucket starts in july, before the requested range
+    start = datetime(2025, 8, 1, 1)
+    with db.with_conn(db_path, rdonly=True) as conn:
+        data = db.read_host_detail(conn, "A", start, start + timedelta(days=100), 300)
+    assert data["level"] == "day"
+    assert data["t"][0] == datetime(2025, 7, 31, 2).timestamp()
+    assert data["uptime"] == [500, 1000]
+    assert data["latency"] == [2000, 1000]
+    assert data["latency_max"] == [4000, 1000]
+
+
+@pytest.mark.parametrize("period", ["2025-8", "2025-09", "../upcheck", ""])
+def test_drop_unknown_partition(db_path, result, period):
+    save(db_path, result(time=datetime(2025, 8, 1)))
+    with pytest.raises(ValueError):
+        db.drop_partition(period, db_path)
+    assert list(db.partitions(db_path)) == ["2025-08"]
+
+
+@pytest.mark.parametrize(
+    "uptime, permille",
+    [(1, 1000), (0.9999, 999), (0.9995, 999), (0.9994, 999), (0.5, 500), (0, 0)],
+)
+def test_uptime_permille(uptime, permille):
+    assert db.uptime_permille(uptime) == permille
+
+
+def test_compact_histograms():
+    nan = float("nan")
+    data = {
+        "A": {
+            "hist_uptime": [1.0, 0.9996, nan],
+            "hist_latency": [0.25, 1.5, nan],
+            "latency_geomean_max": 1.5,
+            "uptime_goal": 0.99,
+        },
+        "B": {
+            "hist_uptime": [nan] * 3,
+            "hist_latency": [nan] * 3,
+            "latency_geomean_max": 0.00001,
+            "uptime_goal": 0.999,
+        },
+    }
+    payload = db.compact_histograms(
+        data, 3, datetime(2025, 7, 1), datetime(2025, 7, 1, 3)
+    )
+    assert payload["start"] == datetime(2025, 7, 1).astimezone().isoformat()
+    assert payload["buckets"] == 3
+    assert payload["hosts"]["A"] == {
+        "uptime": [1000, 999, None],
+        "latency": [250, 1500, None],
+        "latency_max": 1500,
+        "uptime_goal": 0.99,
+    }
+    assert payload["hosts"]["B"]["uptime"] == [None] * 3
+    assert payload["hosts"]["B"]["latency_max"] == 1
+
+
+def test_host_detail_partial_uptime(db_path, result):
+    save(
+        db_path,
+        *(
+            result(time=datetime(2025, 7, 1) + timedelta(seconds=i))
+            for i in range(2000)
+        ),
+        result(time=datetime(2025, 7, 1, 0, 59), passed=False),
+    )
+    with db.with_conn(db_path, rdonly=True) as conn:
+        data = db.read_host_detail(
+            conn, "A", datetime(2025, 7, 1), datetime(2025, 7, 31), 300
+        )
+    # 99.95% in the first hour must not show as full uptime
+    assert data["level"] == "hour"
+    assert data["uptime"] == [999]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import sqlite3
+
+import pytest
+
+from upcheck import db
+from upcheck.migrations import MIGRATIONS, apply_migrations
+
+# schema of the baseline release, where migration 1 has already been applied
+BASELINE_SCHEMA = db.SCHEMA.replace("    cert_expiry REAL,\n", "")
+
+
+def migrate(db_file: str):
+    with db.with_conn(db_file) as conn:
+        apply_migrations(conn)
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master")}
+    assert version == len(MIGRATIONS)
+    assert "checks" not in tables and "snapshots" not in tables
+
+
+def test_migrate_fresh(db_file):
+    db.initialize_db(db_file)
+    migrate(db_file)
+    assert db.partitions(db_file) == {}
+
+
+def test_migrate_populated_baseline(db_file):
+    conn = sqlite3.connect(db_file)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("PRAGMA user_version = 1")
+    now = datetime.now()
+    for i in range(0, 24 * 60):
+        t = now - timedelta(hours=i)
+        conn.execute(
+            "INSERT INTO checks VALUES (?,?,?,?,?,?,?)",
+            ("A", t.timestamp(), 0.5, 10, 200, i % 8 != 0, ""),
+        )
+    conn.execute(
+        "INSERT INTO snapshots VALUES ('u', 'A', ?, 1, 1, 500, '{}', 'x')",
+        (now.timestamp(),),
+    )
+    conn.commit()
+    conn.close()
+
+    migrate(db_file)
+    assert len(db.partitions(db_file)) >= 2
+
+    with db.with_conn(db_file, rdonly=True) as conn:
+        stats = db.all_time_stats(conn)
+        hist = db.read_histogram_new(
+            conn, timedelta(days=61), now + timedelta(seconds=1), 61
+        )
+    assert stats["A"]["total_uptime"] == pytest.approx(7 / 8)
+    assert stats["A"]["total_latency_geomean"] == pytest.approx(0.5)
+    assert hist["A"]["uptime"] == pytest.approx(7 / 8)
+
+
+def test_partition_migration_is_rerunnable(db_file):
+    conn = sqlite3.connect(db_file)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("PRAGMA user_version = 1")
+    conn.execute(
+        "INSERT INTO checks VALUES ('A', ?, 0.5, 10, 200, 1, '')",
+        (datetime.now().timestamp(),),
+    )
+    conn.commit()
+    conn.close()
+
+    # copy the rows into the partition without finishing the migration
+    with db.with_conn(db_file) as conn:
+        MIGRATIONS[1].apply(conn)
+        schema = db.attach_partition(conn, db.partition_period(datetime.now()), False)
+        conn.execute(f"INSERT INTO {schema}.checks SELECT * FROM main.checks")
+        conn.execute("PRAGMA user_version = 2")
+
+    migrate(db_file)
+    with db.with_conn(db_file, rdonly=True) as conn:
+        schema = db.attach_partition(conn, db.partition_period(datetime.now()), True)
+        assert conn.execute(f"SELECT COUNT(*) FROM {schema}.checks").fetchone()[0] == 1
@@ -0,0 +1,253 @@
+import http.server
+import json
+import socketserver
+import threading
+
+import pytest
+import requests
+
+from upcheck.notify import (
+    Channel,
+    EmailChannel,
+    Notifier,
+    NtfyChannel,
+    TelegramChannel,
+    make_channels,
+)
+
+
+class FakeChannel(Channel):
+    def __init__(self, name: str = "fake", fail: int = 0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.fail = fail
+        self.sent: list[tuple[str, str]] = []
+
+    def send(self, subject: str, body: str):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("unreachable")
+        self.sent.append((subject, body))
+
+
+def test_dedupe(result):
+    channel = FakeChannel(batch_window=0)
+    notifier = Notifier([channel], after=2)
+
+    notifier.feed(result("A", passed=False), 0)
+    notifier.tick(0)
+    assert channel.sent == []
+
+    for t in (1, 2, 3):
+        notifier.feed(result("A", passed=False), t)
+        notifier.tick(t)
+    assert channel.sent == [
+        ("UpCheck: A is down", "A down since 2025-07-01 00:00: Status check failed")
+    ]
+
+    notifier.feed(result("A", passed=True), 4)
+    notifier.feed(result("A", passed=True), 5)
+    notifier.tick(5)
+    assert channel.sent[1:] == [
+        ("UpCheck: A recovered", "A recovered at 2025-07-01 00:00")
+    ]
+
+    # a single failure below the threshold is not an incident
+    notifier.feed(result("A", passed=False), 6)
+    notifier.feed(result("A", passed=True), 7)
+    notifier.tick(7)
+    assert len(channel.sent) == 2
+
+
+def test_batching(result):
+    channel = FakeChannel(batch_window=10)
+    notifier = Notifier([channel])
+
+    notifier.feed(result("A", passed=False), 0)
+    notifier.feed(result("B", passed=False), 5)
+    notifier.tick(9)
+    assert channel.sent == []
+
+    notifier.tick(10)
+    assert len(channel.sent) == 1
+    subject, body = channel.sent[0]
+    assert subject == "UpCheck: 2 services down"
+    assert body.splitlines() == [
+        "A down since 2025-07-01 00:00: Status check failed",
+        "B down since 2025-07-01 00:00: Status check failed",
+    ]
+
+
+def test_rate_limit(result):
+    channel = FakeChannel(batch_window=0, rate_limit=2, rate_period=100)
+    notifier = Notifier([channel])
+
+    for t, check in enumerate("ABCD"):
+        notifier.feed(result(check, passed=False), t)
+        notifier.tick(t)
+    assert [s for s, _ in channel.sent] == ["UpCheck: A is down", "UpCheck: B is down"]
+
+    # C and D wait until the first message leaves the window, then go out together
+    notifier.tick(99)
+    assert len(channel.sent) == 2
+    notifier.tick(100)
+    assert channel.sent[2][0] == "UpCheck: 2 services down"
+
+
+def test_backoff(result):
+    channel = FakeChannel(fail=2, batch_window=0, backoff=10, retries=5)
+    notifier = Notifier([channel])
+
+    notifier.feed(result("A", passed=False), 0)
+    for t in (0, 9, 10, 29):
+        notifier.tick(t)
+    assert channel.sent == []
+    # retries after 10 and 20 more seconds
+    notifier.tick(30)
+    assert len(channel.sent) == 1
+
+
+def test_gives_up_after_retries(result):
+    channel = FakeChannel(fail=10, batch_window=0, backoff=1, retries=2)
+    notifier = Notifier([channel])
+
+    notifier.feed(result("A", passed=False), 0)
+    for t in range(10):
+        notifier.tick(t)
+    assert channel.fail == 7
+    assert notifier.states["fake"].pending == []
+
+
+def test_channel_is_abstract():
+    with pytest.raises(TypeError):
+        Channel("base")
+
+
+def test_invalid_config(config):
+    with pytest.raises(ValueError):
+        config(notify_after=0)
+    with pytest.raises(ValueError, match="pager"):
+        make_channels(config(notifications={"x": {"type": "pager"}}))
+    with pytest.raises(ValueError, match="phone"):
+        make_channels(config(notifications={"phone": {"type": "ntfy"}}))
+    with pytest.raises(ValueError, match="phone"):
+        make_channels(
+            config(notifications={"phone": {"type": "ntfy", "url": "u", "to": "x"}})
+        )
+    (channel,) = make_channels(
+        config(notifications={"phone": {"type": "ntfy", "url": "u", "batch_window": 1}})
+    )
+    assert isinstance(channel, NtfyChannel) and channel.batch_window == 1
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough of SMTP for smtplib to deliver a message.
+    """
+
+    def handle(self):
+        def reply(line: str):
+            self.wfile.write(f"{line}\r\n".encode())
+
+        reply("220 localhost")
+        lines = None
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            if lines is not None:
+                if line == ".":
+                    self.server.messages.append("\n".join(lines))
+                    lines = None
+                    reply("250 queued")
+                else:
+                    lines.append(line)
+            elif line[:4].upper() == "DATA":
+                lines = []
+                reply("354 go ahead")
+            elif line[:4].upper() == "QUIT":
+                reply("221 bye")
+                return
+            else:
+                reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_email_channel(smtp_server):
+    channel = EmailChannel(
+        "mail",
+        to=["a@example.com", "b@example.com"],
+        sender="upcheck@example.com",
+        host="127.0.0.1",
+        port=smtp_server.server_address[1],
+        starttls=False,
+    )
+    channel.send("UpCheck: A is down", "A down since ...")
+    (message,) = smtp_server.messages
+    assert "Subject: UpCheck: A is down" in message
+    assert "To: a@example.com, b@example.com" in message
+    assert "A down since ..." in message
+
+
+class RecordingHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+
+@pytest.fixture
+def recorder(http_server):
+    server = http_server(RecordingHandler)
+    server.requests = []
+    server.status = 200
+    return server
+
+
+def test_ntfy_channel(recorder):
+    url = f"{recorder.url}/my-topic"
+    NtfyChannel("phone", url=url, token="secret").send("UpCheck: A is down", "body")
+    (request,) = recorder.requests
+    path, headers, body = request
+    assert path == "/"
+    assert headers["Authorization"] == "Bearer secret"
+    assert json.loads(body) == {
+        "topic": "my-topic",
+        "title": "UpCheck: A is down",
+        "message": "body",
+        "tags": ["warning"],
+    }
+
+    recorder.status = 500
+    with pytest.raises(requests.HTTPError):
+        NtfyChannel("phone", url=url).send("subject", "body")
+
+
+def test_ntfy_unicode_check_name(recorder, result):
+    notifier = Notifier([NtfyChannel("phone", url=f"{recorder.url}/t", batch_window=0)])
+    notifier.feed(result("東京", passed=False), 0)
+    notifier.tick(0)
+    (request,) = recorder.requests
+    assert json.loads(request[2])["title"] == "UpCheck: 東京 is down"
+    assert notifier.states["phone"].pending == []
+
+
+def test_telegram_token_is_not_logged(recorder, result, capsys):
+    recorder.status = 404
+    channel = TelegramChannel(
+        "chat", token="123:SECRET", chat_id=1, api_url=recorder.url, batch_window=0
+    )
+    notifier = Notifier([channel])
+    notifier.feed(result(passed=False), 0)
+    notifier.tick(0)
+    assert recorder.requests[0][0] == "/bot123:SECRET/sendMessage"
+    err = capsys.readouterr().err
+    assert "404" in err
+    assert "SECRET" not in err
@@ -0,0 +1,146 @@
+from datetime import datetime
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from upcheck import daemon, db
+from upcheck.spool import Spool
+
+
+def test_round_trip(spool):
+    spool.put("a")
+    spool.put({"b": 1})
+    assert spool.pending() == 2
+
+    batch = spool.get(10, timeout=0)
+    assert [item for _, item in batch] == ["a", {"b": 1}]
+    # unacknowledged items are delivered again
+    assert spool.get(10, timeout=0) == batch
+
+    spool.ack([batch[0][0]])
+    assert [item for _, item in spool.get(10, timeout=0)] == [{"b": 1}]
+    spool.ack([batch[1][0]])
+    assert spool.get(10, timeout=0) == []
+    assert spool.lag() == {"pending": 0, "age": 0.0}
+
+
+def test_survives_reopen(spool):
+    spool.put("a")
+    again = Spool(spool.path)
+    assert [item for _, item in again.get(1, timeout=0)] == ["a"]
+
+
+def test_get_waits_for_items(spool):
+    threading.Timer(0.3, lambda: Spool(spool.path).put("late")).start()
+    start = time.monotonic()
+    assert [item for _, item in spool.get(1, timeout=5)] == ["late"]
+    assert time.monotonic() - start < 5
+
+
+def test_backpressure(spool):
+    for i in range(3):
+        spool.put(i)
+
+    put = threading.Thread(target=lambda: Spool(spool.path, 3).put(3))
+    put.start()
+    put.join(1.5)
+    assert put.is_alive()
+    assert spool.pending() == 3
+
+    spool.ack([id for id, _ in spool.get(1, timeout=0)])
+    put.join(5)
+    assert not put.is_alive()
+    assert [item for _, item in spool.get(10, timeout=0)] == [1, 2, 3]
+
+
+def test_write_batch_saves_everything(db_path, result):
+    batch = [
+        (1, (result(time=datetime(2025, 7, 1)), None)),
+        (2, (result(time=datetime(2025, 7, 31)), None)),
+    ]
+    assert daemon._write_batch(batch, db_path) == batch
+    # saving again does not count results twice
+    assert daemon._write_batch(batch, db_path) == batch
+    with db.with_conn(db_path, rdonly=True) as conn:
+        schema = db.attach_partition(conn, "2025-07", rdonly=True)
+        n = conn.execute(f"SELECT SUM(n) FROM {schema}.checks_day").fetchone()[0]
+    assert n == 2
+
+
+def test_write_batch_drops_broken_results(db_path, result):
+    # check_name is NOT NULL
+    broken = (2, (result(check=None, time=datetime(2025, 7, 2)), None))
+    batch = [
+        (1, (result(time=datetime(2025, 7, 1)), None)),
+        broken,
+        (3, (result(check="B", time=datetime(2025, 7, 3)), None)),
+    ]
+    assert daemon._write_batch(batch, db_path) == batch
+    with db.with_conn(db_path, rdonly=True) as conn:
+        schema = db.attach_partition(conn, "2025-07", rdonly=True)
+        names = conn.execute(f"SELECT check_name FROM {schema}.checks").fetchall()
+    assert sorted(name for name, in names) == ["A", "B"]
+
+
+def test_write_batch_keeps_results_on_transient_errors(tmp_path, result):
+    batch = [(1, (result(time=datetime(2025, 7, 1)), None))]
+    missing = str(tmp_path / "missing" / "upcheck.db")
+    assert daemon._write_batch(batch, missing) == []
+
+
+def test_unreadable_items_are_dropped(spool):
+    spool.put("a")
+    spool._connect().execute(
+        "INSERT INTO spool(enqueued, payload) VALUES (?, ?)", (time.time(), b"garbage")
+    )
+    spool.put("b")
+    assert [item for _, item in spool.get(10, timeout=0)] == ["a", "b"]
+    spool.ack([id for id, _ in spool.get(10, timeout=0)])
+    assert spool.get(10, timeout=0) == []
+
+
+class FlakySpool:
+    def __init__(self, errors: int):
+        self.errors = errors
+        self.items = []
+
+    def put(self, item):
+        if self.errors:
+            self.errors -= 1
+            raise sqlite3.OperationalError("database or disk is full")
+        self.items.append(item)
+
+
+def test_spooling_retries_until_next_check(monkeypatch, result):
+    monkeypatch.setattr(daemon, "SPOOL_RETRY_DELAY", 0.01)
+    out = FlakySpool(errors=2)
+    daemon._spool_result(out, (result(), None), time.time() + 5)
+    assert out.items == [(result(), None)]
+
+    # gives up once the next check is due
+    out = FlakySpool(errors=1000)
+    daemon._spool_result(out, (result(), None), time.time() + 0.1)
+    assert out.items == []
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_writer_survives_errors(monkeypatch, spool):
+    monkeypatch.setattr(daemon, "SPOOL_RETRY_DELAY", 0)
+    monkeypatch.setattr(daemon, "_seal_finished_partitions", lambda *args: None)
+    calls = []
+
+    def get(n, timeout):
+        calls.append(n)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("disk I/O error")
+        raise Stop()
+
+    monkeypatch.setattr(spool, "get", get)
+    with pytest.raises(Stop):
+        daemon.writer_damon(spool, seal_delay=0)
+    assert len(calls) == 3
@@ -1,14 +1,178 @@
+from dataclasses import dataclass
 from datetime import datetime
+import errno
 import json
+import os
 import requests
 import re
+import select
+import socket
+import ssl
+import time
 import uuid
 
-from upcheck.model import ConnCheckRes, ConnCheckSpec, Config, Snapshot
+from upcheck.model import ConnCheckRes, ConnCheckSpec, Config, Snapshot, host_port
 
 
 def check_conn(
     config: Config, check: ConnCheckSpec
+) -> tuple[ConnCheckRes, Snapshot | None]:
+    if check.type == "tcp":
+        return check_tcp(check), None
+    if check.type == "tls":
+        return check_tls(check), None
+    return check_http(config, check)
+
+
+def _wait(sock: socket.socket, deadline: float, write: bool):
+    """
+    Block until the socket is readable (or writable) or the deadline is reached.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError()
+    rlist, wlist = ([], [sock]) if write else ([sock], [])
+    if not any(select.select(rlist, wlist, [], remaining)[:2]):
+        raise TimeoutError()
+
+
+def _connect(host: str, port: int, deadline: float) -> socket.socket:
+    """
+    Open a TCP connection using a non-blocking socket, trying all addresses of host
+    in turn until one accepts the connection or the deadline is reached.
+
+    Note that socket.getaddrinfo blocks and ignores the deadline, so a slow DNS
+    lookup can make the check take longer than its timeout.
+    """
+    last_error: OSError = OSError(f"No addresses for {host}")
+    for family, kind, proto, _, addr in socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM
+    ):
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        try:
+            err = sock.connect_ex(addr)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                raise OSError(err, os.strerror(err))
+            _wait(sock, deadline, write=True)
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err != 0:
+                raise OSError(err, os.strerror(err))
+            return sock
+        except TimeoutError:
+            sock.close()
+            raise
+        except OSError as ex:
+            sock.close()
+            last_error = ex
+    raise last_error
+
+
+def _probe_failed(check: ConnCheckSpec, now: datetime, error: str) -> ConnCheckRes:
+    return ConnCheckRes(check.name, now, float("nan"), None, None, False, [error])
+
+
+def check_tcp(check: ConnCheckSpec) -> ConnCheckRes:
+    now = datetime.now()
+    t0 = time.monotonic()
+    try:
+        host, port = host_port(check.url, check.type)
+        _connect(host, port, t0 + check.timeout).close()
+    except TimeoutError:
+        return _probe_failed(check, now, "Connection timed out")
+    except (OSError, ValueError):
+        return _probe_failed(check, now, "Connection Error")
+
+    return ConnCheckRes(check.name, now, time.monotonic() - t0, None, None, True, ())
+
+
+def check_tls(check: ConnCheckSpec) -> ConnCheckRes:
+    now = datetime.now()
+    t0 = time.monotonic()
+    deadline = t0 + check.timeout
+    try:
+        host, port = host_port(check.url, check.type)
+        sock = _connect(host, port, deadline)
+    except TimeoutError:
+        return _probe_failed(check, now, "Connection timed out")
+    except (OSError, ValueError):
+        return _probe_failed(check, now, "Connection Error")
+
+    ctx = ssl.create_default_context()
+    try:
+        with ctx.wrap_socket(
+            sock, server_hostname=host, do_handshake_on_connect=False
+        ) as tls:
+            while True:
+                try:
+                    tls.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    _wait(tls, deadline, write=False)
+                except ssl.SSLWantWriteError:
+                    _wait(tls, deadline, write=True)
+            cert = tls.getpeercert()
+    except TimeoutError:
+        return _probe_failed(check, now, "TLS handshake timed out")
+    except ssl.SSLCertVerificationError:
+        return _probe_failed(check, now, "Certificate verification failed")
+    except (ssl.SSLError, OSError):
+        return _probe_failed(check, now, "TLS handshake failed")
+    finally:
+        sock.close()
+
+    duration = time.monotonic() - t0
+    expiry = datetime.fromtimestamp(ssl.cert_time_to_seconds(cert["notAfter"]))
+
+    errors = []
+    if (expiry - now).total_seconds() < check.cert_expiry_days * 24 * 60 * 60:
+        errors.append("Certificate expires soon")
+
+    return ConnCheckRes(
+        check.name,
+        now,
+        duration,
+        None,
+        None,
+        not errors,
+        tuple(errors),
+        cert_expiry=expiry,
+    )
+
+
+@dataclass
+class _Validators:
+    """
+    Cache validators and verdict of the last full response of a check.
+    """
+
+    etag: str | None
+    last_modified: str | None
+    status: int
+    body_ok: bool
+
+
+_VALIDATORS: dict[str, _Validators] = {}
+"""
+Validators per check name. Each check runs in its own process, so this is never shared.
+"""
+
+
+def _request_headers(config: Config, check: ConnCheckSpec) -> dict[str, str]:
+    headers = {"User-Agent": config.user_agent}
+    if check.range_bytes:
+        headers["Range"] = f"bytes=0-{check.range_bytes - 1}"
+    cached = _VALIDATORS.get(check.name) if check.conditional else None
+    if cached is not None:
+        if cached.etag is not None:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified is not None:
+            headers["If-Modified-Since"] = cached.last_modified
+    return headers
+
+
+def check_http(
+    config: Config, check: ConnCheckSpec
 ) -> tuple[ConnCheckRes, Snapshot | None]:
     now = datetime.now()
     try:
@@ -17,8 +181,20 @@ def check_conn(
             check.url,
             timeout=check.timeout,
             allow_redirects=True,
-            headers={"User-Agent": config.user_agent},
+            headers=_request_headers(config, check),
+            stream=check.range_bytes is not None,
         )
+        if check.range_bytes:
+            # don't read past the range, even if the server ignored it
+            with res:
+                body_bytes = b""
+                for chunk in res.iter_content(check.range_bytes):
+                    body_bytes += chunk
+                    if len(body_bytes) >= check.range_bytes:
+                        break
+                body_bytes = body_bytes[: check.range_bytes]
+        else:
+            body_bytes = res.content
     except requests.Timeout:
         return (
             ConnCheckRes(
@@ -40,24 +216,47 @@ def check_conn(
             ),
             None,
         )
+    except requests.RequestException:
+        # e.g. the connection broke while reading the body
+        return (
+            ConnCheckRes(
+                check.name, now, float("nan"), None, None, False, ["Invalid Response"]
+            ),
+            None,
+        )
 
     errors = []
-    body_bytes = res.content
-    body = body_bytes.decode()
+    # pages may not be utf-8 and a range may end in the middle of a character
+    body = body_bytes.decode(errors="replace")
 
-    body_ok = True
-    status_ok = True
+    cached = _VALIDATORS.get(check.name)
+    if res.status_code == 304 and check.conditional and cached is not None:
+        # not modified, reuse the verdict of the last full response
+        status, body_ok = cached.status, cached.body_ok
+    else:
+        status = res.status_code
+        if status == 206 and check.range_bytes:
+            status = 200
+        body_ok = True
+        if check.body:
+            body_ok = re.compile(check.body).search(body) is not None
 
-    if not res.status_code in check.status:
-        status_ok = False
-        errors.append("Status check failed")
+        if check.conditional:
+            _VALIDATORS[check.name] = _Validators(
+                res.headers.get("ETag"),
+                res.headers.get("Last-Modified"),
+                status,
+                body_ok,
+            )
 
-    if check.body:
-        body_ok = re.compile(check.body).search(body) is not None
+    status_ok = status in check.status
+    if not status_ok:
+        errors.append("Status check failed")
+    if not body_ok:
         errors.append("Body check failed")
 
     snapshot = None
-    if not (status_ok and body_ok):
+    if not (status_ok and body_ok) and res.status_code != 304:
         # create a snapshot:
         snapshot = Snapshot(
             str(uuid.uuid4()),
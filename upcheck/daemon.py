@@ -1,16 +1,34 @@
+from datetime import datetime
 import random
+import sqlite3
 import sys
 import time
 from upcheck.model import Config, ConnCheckRes, Snapshot
 from upcheck.check import check_conn
-from upcheck.db import save_check, save_snapshot, with_conn
-from queue import Queue
+from upcheck.notify import make_channels, notify_daemon
+from upcheck.spool import Spool
+from upcheck.db import (
+    DB_PATH,
+    attach_partition,
+    partition_period,
+    save_check,
+    save_snapshot,
+    seal_partitions,
+    with_conn,
+)
+from queue import Full, Queue
 import traceback
 
 import multiprocessing
+import multiprocessing.queues
 
 
-def check_daemon(cfg: Config, host: str, out: multiprocessing.Queue):
+def check_daemon(
+    cfg: Config,
+    host: str,
+    out: Spool,
+    notify: multiprocessing.queues.Queue | None = None,
+):
     # sleep random interval up to 5 seconds to prevent all requests from going at the same time
     time.sleep(random.random() * 5)
 
@@ -22,7 +40,16 @@ def check_daemon(cfg: Config, host: str, out: multiprocessing.Queue):
         if last_check + cfg.interval < time.time():
             # do check
             last_check += cfg.interval
-            out.put(check_conn(cfg, check))
+            res, snap = check_conn(cfg, check)
+            _spool_result(out, (res, snap), last_check + cfg.interval)
+            if notify is not None:
+                try:
+                    notify.put_nowait(res)
+                except Full:
+                    print(
+                        f"Notification queue full, dropping {check.name}",
+                        file=sys.stderr,
+                    )
 
         # sleep until the next check is due:
         sleep_time = (last_check + cfg.interval) - time.time()
@@ -36,34 +63,184 @@ def check_daemon(cfg: Config, host: str, out: multiprocessing.Queue):
             time.sleep(sleep_time)
 
 
-def writer_damon(queue: Queue[ConnCheckRes]):
+def _spool_result(out: Spool, item: tuple, until: float):
+    """
+    Put a result into the spool, retrying on errors (e.g. disk full or the spool being
+    locked for too long) until the next check is due.
+    """
     while True:
-        check, snap = queue.get()
         try:
-            with with_conn() as conn:
-                if isinstance(check, ConnCheckRes):
-                    save_check(conn, check)
-                    print("Got Trace")
+            out.put(item)
+            return
+        except sqlite3.Error as ex:
+            res, _ = item
+            if time.time() + SPOOL_RETRY_DELAY >= until:
+                print(
+                    f"Error spooling result of {res.check}, dropping it: '{ex}'",
+                    file=sys.stderr,
+                )
+                return
+            print(f"Error spooling result of {res.check}: '{ex}'", file=sys.stderr)
+            time.sleep(SPOOL_RETRY_DELAY)
+
+
+RETRY_ERRORS = (
+    "SQLITE_BUSY",
+    "SQLITE_LOCKED",
+    "SQLITE_IOERR",
+    "SQLITE_FULL",
+    "SQLITE_READONLY",
+    "SQLITE_CANTOPEN",
+)
+"""
+Errors after which results are kept in the spool and saving is retried later.
+"""
+
+
+SEAL_INTERVAL = 60
+"""
+Seconds between checking for partitions that can be sealed.
+"""
+
+SPOOL_RETRY_DELAY = 5
+"""
+Seconds to wait before retrying after the spool failed.
+"""
+
+
+def _is_transient(ex: Exception) -> bool:
+    return isinstance(ex, sqlite3.OperationalError) and (
+        ex.sqlite_errorname.startswith(RETRY_ERRORS)
+    )
+
 
+def _save(conn: sqlite3.Connection, check: ConnCheckRes, snap: Snapshot | None):
+    if isinstance(check, ConnCheckRes):
+        save_check(conn, check)
+    if isinstance(snap, Snapshot):
+        save_snapshot(conn, snap)
+
+
+def _write_batch(
+    batch: list[tuple[int, tuple]], db_path: str = DB_PATH
+) -> list[tuple[int, tuple]]:
+    """
+    Save a batch from the spool and return the items that are done, either saved or
+    dropped because they can never be saved. Stops at the first transient error.
+    """
+    try:
+        with with_conn(db_path) as conn:
+            # attaching a partition commits, so attach all of them up front to save the
+            # batch in one transaction. A batch spanning more partitions than can be
+            # attached at once is committed in parts, which is fine as saving is
+            # idempotent and unacknowledged results are saved again.
+            for _, (check, snap) in batch:
+                if isinstance(check, ConnCheckRes):
+                    attach_partition(conn, partition_period(check.time), False)
                 if isinstance(snap, Snapshot):
-                    save_snapshot(conn, snap)
-                    print("Got Snapshot")
+                    attach_partition(conn, partition_period(snap.timestamp), False)
+            for _, (check, snap) in batch:
+                _save(conn, check, snap)
+        return batch
+    except Exception as ex:
+        print(f"Error saving batch: '{ex}'", file=sys.stderr)
+
+    # save results one by one to only drop the broken ones
+    done = []
+    for item in batch:
+        _, (check, snap) = item
+        try:
+            with with_conn(db_path) as conn:
+                _save(conn, check, snap)
         except Exception as ex:
-            print(f"Error saving document: '{ex}' - {check.json()}", file=sys.stderr)
+            if _is_transient(ex):
+                break
+            print(
+                f"Error saving document: '{ex}' - {check.json()}",
+                file=sys.stderr,
+            )
             traceback.print_exc()
+        done.append(item)
+    return done
+
+
+def _seal_finished_partitions(spool: Spool, seal_delay: float):
+    """
+    Seal partitions of past months once no more results for them can arrive.
+
+    A result is put into the spool at most seal_delay seconds after its check started,
+    so all results of a month are stored once seal_delay has passed since the month
+    ended and nothing older is waiting in the spool.
+    """
+    try:
+        oldest = spool.oldest()
+        until = min(time.time(), oldest if oldest is not None else float("inf"))
+        seal_partitions(datetime.fromtimestamp(until - seal_delay))
+    except Exception as ex:
+        print(f"Error sealing partitions: '{ex}'", file=sys.stderr)
+        traceback.print_exc()
+
+
+def _write_pending(spool: Spool, batch_size: int):
+    batch = spool.get(batch_size, timeout=5)
+    if not batch:
+        return
+
+    done = _write_batch(batch)
+
+    # saving is idempotent, so results are only acknowledged once they are stored
+    spool.ack([id for id, _ in done])
+    if len(done) < len(batch):
+        # database locked or unavailable, keep the rest in the spool and retry
+        lag = spool.lag()
+        print(
+            f"Database unavailable, {lag['pending']} results pending, oldest {lag['age']:.0f}s",
+            file=sys.stderr,
+        )
+        time.sleep(SPOOL_RETRY_DELAY)
+
+
+def writer_damon(spool: Spool, seal_delay: float, batch_size: int = 100):
+    next_seal = time.monotonic()
+    while True:
+        if time.monotonic() >= next_seal:
+            _seal_finished_partitions(spool, seal_delay)
+            next_seal = time.monotonic() + SEAL_INTERVAL
+
+        # the check daemons block once the spool is full, so the writer must not die
+        try:
+            _write_pending(spool, batch_size)
+        except Exception as ex:
+            print(f"Error writing results: '{ex}'", file=sys.stderr)
+            traceback.print_exc()
+            time.sleep(SPOOL_RETRY_DELAY)
 
 
 def spawn_daemons(cfg: Config):
-    queue: Queue[tuple[ConnCheckRes, None | Snapshot]] = multiprocessing.Queue()
+    # fail on startup instead of in the notification process on invalid channels
+    channels = make_channels(cfg)
+    spool = Spool()
+
+    # notifications get their own bounded queue so slow channels never stall ingest
+    notify: Queue[ConnCheckRes] | None = None
+    if channels:
+        notify = multiprocessing.Queue(maxsize=1000)
+        multiprocessing.Process(
+            target=notify_daemon,
+            args=(channels, cfg.notify_after, notify),
+            daemon=True,
+        ).start()
 
     for host in cfg.checks:
         multiprocessing.Process(
-            target=check_daemon, args=(cfg, host, queue), daemon=True
+            target=check_daemon, args=(cfg, host, spool, notify), daemon=True
         ).start()
 
+    # checks finish within their timeout, allow some slack for reading bodies etc.
+    seal_delay = max((c.timeout for c in cfg.checks.values()), default=0) + 5 * 60
     multiprocessing.Process(
         target=writer_damon,
-        args=(queue,),
+        args=(spool, seal_delay),
         daemon=True,
     ).start()
     print("All processes started successfully")
@@ -2,9 +2,12 @@ from collections import defaultdict
 from collections.abc import Sequence
 from contextlib import contextmanager
 from datetime import datetime, timedelta
+from math import exp
+import glob
 import json
 import os
 import sqlite3
+import stat
 from threading import Lock
 import time
 from typing import Generator
@@ -21,6 +24,7 @@ CREATE TABLE checks (
     status INTEGER,
     passed BOOL NOT NULL,
     errors TEXT NOT NULL,
+    cert_expiry REAL,
     PRIMARY KEY (check_name, timestamp)
 );
 
@@ -51,6 +55,53 @@ CREATE INDEX incidents_time ON incidents (start_time, end_time);
 CREATE INDEX incidents_check ON incidents (check_name);
 """
 
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.checks (
+    check_name TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    duration REAL,
+    size INTEGER,
+    status INTEGER,
+    passed BOOL NOT NULL,
+    errors TEXT NOT NULL,
+    cert_expiry REAL,
+    PRIMARY KEY (check_name, timestamp)
+);
+
+CREATE TABLE IF NOT EXISTS {schema}.snapshots (
+    uuid TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    duration REAL NOT NULL,
+    size INT NOT NULL,
+    status INT NOT NULL,
+    headers TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (uuid)
+);
+
+CREATE INDEX IF NOT EXISTS {schema}.snapshots_name ON snapshots (check_name, timestamp);
+""" + "".join(
+    f"""
+CREATE TABLE IF NOT EXISTS {{schema}}.checks_{level} (
+    check_name TEXT NOT NULL,
+    bucket REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    log_duration REAL NOT NULL,
+    n_duration INTEGER NOT NULL,
+    log_duration_max REAL,
+    PRIMARY KEY (check_name, bucket)
+);
+""" for level in ("hour", "day")
+)
+
+ROLLUPS = {"hour": 60 * 60, "day": 24 * 60 * 60}
+"""
+Pre-aggregated levels of detail of the checks table, with their bucket size in seconds.
+"""
+
+
 def initialize_db(db_path: str = DB_PATH, soft: bool = False):
     if os.path.exists(db_path):
         if soft:
@@ -102,84 +153,228 @@ def with_conn(
         _POOL[rdonly].append(conn)
 
 
+def close_pool():
+    """
+    Close all idle pooled connections.
+    """
+    with _POOL_LOCK:
+        for pool in _POOL.values():
+            while pool:
+                pool.pop().close()
+
+
+def partition_period(t: datetime) -> str:
+    """
+    Name of the partition that holds data for time t (one partition per month).
+    """
+    return t.strftime("%Y-%m")
+
+
+def partition_path(db_path: str, period: str) -> str:
+    return f"{os.path.splitext(db_path)[0]}.{period}.db"
+
+
+def main_db_path(conn: sqlite3.Connection) -> str:
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2]
+    raise RuntimeError("Connection has no main database")
+
+
+def partitions(db_path: str = DB_PATH) -> dict[str, str]:
+    """
+    All existing partitions as period -> file path, sorted by period.
+    """
+    prefix = f"{os.path.splitext(db_path)[0]}."
+    return {
+        path[len(prefix) : -len(".db")]: path
+        for path in sorted(
+            glob.glob(f"{glob.escape(prefix)}[0-9][0-9][0-9][0-9]-[0-9][0-9].db")
+        )
+    }
+
+
+def partitions_between(db_path: str, start: datetime, end: datetime) -> dict[str, str]:
+    """
+    Existing partitions overlapping the window [start, end).
+    """
+    first, last = partition_period(start), partition_period(end)
+    return {
+        period: path
+        for period, path in partitions(db_path).items()
+        if first <= period <= last
+    }
+
+
+SEALED_MODE = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def is_sealed(path: str) -> bool:
+    return not os.stat(path).st_mode & stat.S_IWUSR
+
+
+def attach_partition(conn: sqlite3.Connection, period: str, rdonly: bool) -> str:
+    """
+    Attach the partition for period to conn (if it isn't already) and return its schema name.
+
+    Sealed partitions are attached read-only, unless rdonly is unset: then they are
+    reopened for writing late results and sealed again by the next seal_partitions.
+    Missing partitions are created unless rdonly is set.
+    """
+    schema = "p" + period.replace("-", "_")
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if schema in attached:
+        return schema
+
+    path = partition_path(main_db_path(conn), period)
+    exists = os.path.exists(path)
+    if rdonly and not exists:
+        raise FileNotFoundError(path)
+    ro = exists and rdonly
+    if exists and not rdonly and is_sealed(path):
+        print(f"reopening sealed partition {period} for late results")
+        os.chmod(path, SEALED_MODE | stat.S_IWUSR)
+
+    # ATTACH/DETACH are not allowed inside a transaction, this commits pending changes
+    conn.autocommit = True
+    try:
+        # evict the oldest partitions if we are at the limit of attached databases,
+        # keeping one slot free as VACUUM needs it
+        others = [name for name in attached if name not in ("main", "temp")]
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        for old in others[: max(0, len(others) + 2 - limit)]:
+            conn.execute(f"DETACH DATABASE {old}")
+        conn.execute(
+            f"ATTACH DATABASE ? AS {schema}",
+            (f"file:{path}{'?mode=ro' if ro else ''}",),
+        )
+        if not ro:
+            conn.executescript(PARTITION_SCHEMA.format(schema=schema))
+    finally:
+        conn.autocommit = False
+    return schema
+
+
+def partition_end(period: str) -> datetime:
+    """
+    Start of the period following period.
+    """
+    year, month = map(int, period.split("-"))
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def seal_partitions(until: datetime, db_path: str = DB_PATH):
+    """
+    Optimize and mark all partitions of periods that ended before until as read-only.
+
+    Callers must make sure no more results for these periods will arrive, late results
+    reopen the partition (see attach_partition).
+    """
+    # idle connections may still have a partition attached read-write
+    close_pool()
+    for period, path in partitions(db_path).items():
+        if partition_end(period) > until or is_sealed(path):
+            continue
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            conn.execute("ANALYZE")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        os.chmod(path, SEALED_MODE)
+        print(f"sealed partition {period}")
+
+
+def drop_partition(period: str, db_path: str = DB_PATH):
+    """
+    Delete all checks and snapshots of a period, raises ValueError if there is no
+    partition for it.
+    """
+    path = partitions(db_path).get(period)
+    if path is None:
+        raise ValueError(f"No partition for {period!r}, periods are named YYYY-MM")
+    # pooled connections may still have the partition attached
+    close_pool()
+    os.remove(path)
+
+
 def coalesce(*args):
     for arg in args:
         if arg is not None:
             return arg
 
+
 def read_histogram_new(
     conn: sqlite3.Connection,
     timespan: timedelta,
     end: datetime,
     buckets: int,
 ):
-    res = conn.execute(
-        """
-WITH bucketed AS (
-    SELECT
-        check_name,
-        timestamp,
-        passed,
-        LN(duration) AS duration
-    FROM checks
-    WHERE timestamp >= :start_date
-      AND timestamp < :end_date
-),
-per_bucket AS (
-    SELECT
-        check_name,
-        CAST((timestamp - :start_date) / :seconds_per_bucket AS INTEGER) AS bucket,
-        AVG(passed) AS avg_uptime,
-        EXP(AVG(duration)) AS geomean_latency,
-        NULL AS latency_max
-    FROM bucketed
-    GROUP BY check_name, bucket
-),
-overall AS (
-    SELECT
-        check_name,
-        NULL AS bucket,
-        AVG(passed) AS avg_uptime,
-        EXP(AVG(duration)) AS geomean_latency,
-        EXP(MAX(duration)) as latency_max
-    FROM bucketed
-    GROUP BY check_name
-)
-SELECT * FROM per_bucket
-UNION ALL
-SELECT * FROM overall
+    start = end - timespan
+    params = {
+        "start_date": start.timestamp(),
+        "end_date": (end).timestamp(),
+        "seconds_per_bucket": timespan.total_seconds() / buckets,
+    }
+    # per (check, bucket): [passed, count, sum log(duration), count log(duration), max log(duration)]
+    sums: dict[str, dict[int, list[float]]] = defaultdict(dict)
+    for period in partitions_between(main_db_path(conn), start, end):
+        schema = attach_partition(conn, period, rdonly=True)
+        res = conn.execute(
+            f"""
+SELECT
+    check_name,
+    CAST((timestamp - :start_date) / :seconds_per_bucket AS INTEGER) AS bucket,
+    SUM(passed) AS passed,
+    COUNT(*) AS n,
+    SUM(LN(duration)) AS log_duration,
+    COUNT(LN(duration)) AS n_duration,
+    MAX(LN(duration)) AS log_duration_max
+FROM {schema}.checks
+WHERE timestamp >= :start_date
+  AND timestamp < :end_date
+GROUP BY check_name, bucket
 """,
-        {
-            "start_date": (end - timespan).timestamp(),
-            "end_date": (end).timestamp(),
-            "seconds_per_bucket": timespan.total_seconds() / buckets,
-        },
-    )
+            params,
+        )
+        for row in res:
+            acc = sums[row["check_name"]].setdefault(
+                row["bucket"], [0, 0, 0.0, 0, float("-inf")]
+            )
+            acc[0] += row["passed"]
+            acc[1] += row["n"]
+            acc[2] += coalesce(row["log_duration"], 0.0)
+            acc[3] += row["n_duration"]
+            acc[4] = max(acc[4], coalesce(row["log_duration_max"], float("-inf")))
+
+    def geomean(log_sum: float, n: int) -> float:
+        return exp(log_sum / n) if n else float("nan")
+
     data = {}
-    for row in res:
-        bucket = row["bucket"]
-        check = row["check_name"]
-        if check not in data:
-            data[check] = {
-                "hist_latency": [float("nan")] * buckets,
-                "hist_uptime": [float("nan")] * buckets,
-                "uptime": 0,
-                "latency_geomean": 1,
-                "latency_max": 1,
-            }
-        if bucket is None:
-            data[check]["uptime"] = coalesce(row["avg_uptime"], float('nan'))
-            data[check]["latency_geomean"] = coalesce(row["geomean_latency"], float('nan'))
-            data[check]["latency_max"] = coalesce(row["latency_max"], float('nan'))
-        else:
-            data[check]["hist_latency"][bucket] = coalesce(row["geomean_latency"], float('nan'))
-            data[check]["hist_uptime"][bucket] = coalesce(row["avg_uptime"], float('nan'))
+    for check, per_bucket in sums.items():
+        data[check] = {
+            "hist_latency": [float("nan")] * buckets,
+            "hist_uptime": [float("nan")] * buckets,
+        }
+        for bucket, (passed, n, log_dur, n_dur, _) in per_bucket.items():
+            data[check]["hist_latency"][bucket] = geomean(log_dur, n_dur)
+            data[check]["hist_uptime"][bucket] = passed / n
+
+        passed, n, log_dur, n_dur = (
+            sum(acc[i] for acc in per_bucket.values()) for i in range(4)
+        )
+        log_max = max(acc[4] for acc in per_bucket.values())
+        data[check]["uptime"] = passed / n
+        data[check]["latency_geomean"] = geomean(log_dur, n_dur)
+        data[check]["latency_max"] = exp(log_max) if n_dur else float("nan")
     return data
 
 
 def save_check(conn: sqlite3.Connection, res: ConnCheckRes):
-    conn.execute(
-        "INSERT INTO checks(check_name, timestamp, duration, size, status, passed, errors) VALUES (?,?,?,?,?,?,?)",
+    schema = attach_partition(conn, partition_period(res.time), rdonly=False)
+    # results may be delivered more than once, only count them once in the rollups
+    cur = conn.execute(
+        f"INSERT OR IGNORE INTO {schema}.checks(check_name, timestamp, duration, size, status, passed, errors, cert_expiry) VALUES (?,?,?,?,?,?,?,?)",
         (
             res.check,
             res.time.timestamp(),
@@ -188,13 +383,73 @@ def save_check(conn: sqlite3.Connection, res: ConnCheckRes):
             res.status,
             res.passed,
             "\n".join(res.errors),
+            res.cert_expiry.timestamp() if res.cert_expiry else None,
         ),
     )
+    if cur.rowcount == 0:
+        return
+    for level, seconds in ROLLUPS.items():
+        conn.execute(
+            f"""
+INSERT INTO {schema}.checks_{level}(check_name, bucket, passed, n, log_duration, n_duration, log_duration_max)
+VALUES (
+    :check,
+    CAST(:timestamp / :seconds AS INTEGER) * :seconds,
+    :passed,
+    1,
+    COALESCE(LN(:duration), 0),
+    LN(:duration) IS NOT NULL,
+    LN(:duration)
+)
+ON CONFLICT (check_name, bucket) DO UPDATE SET
+    passed = passed + excluded.passed,
+    n = n + 1,
+    log_duration = log_duration + excluded.log_duration,
+    n_duration = n_duration + excluded.n_duration,
+    log_duration_max = MAX(
+        COALESCE(log_duration_max, excluded.log_duration_max),
+        COALESCE(excluded.log_duration_max, log_duration_max)
+    )
+""",
+            {
+                "check": res.check,
+                "timestamp": res.time.timestamp(),
+                "seconds": seconds,
+                "passed": res.passed,
+                "duration": res.duration,
+            },
+        )
+
+
+def build_rollups(conn: sqlite3.Connection, schema: str = "main"):
+    """
+    (Re)build the rollup tables of a partition from its checks.
+    """
+    conn.executescript(PARTITION_SCHEMA.format(schema=schema))
+    for level, seconds in ROLLUPS.items():
+        conn.execute(f"DELETE FROM {schema}.checks_{level}")
+        conn.execute(
+            f"""
+INSERT INTO {schema}.checks_{level}(check_name, bucket, passed, n, log_duration, n_duration, log_duration_max)
+SELECT
+    check_name,
+    CAST(timestamp / :seconds AS INTEGER) * :seconds AS bucket,
+    SUM(passed),
+    COUNT(*),
+    TOTAL(LN(duration)),
+    COUNT(LN(duration)),
+    MAX(LN(duration))
+FROM {schema}.checks
+GROUP BY check_name, bucket
+""",
+            {"seconds": seconds},
+        )
 
 
 def save_snapshot(conn: sqlite3.Connection, snap: Snapshot):
+    schema = attach_partition(conn, partition_period(snap.timestamp), rdonly=False)
     conn.execute(
-        "INSERT INTO snapshots(uuid, check_name, timestamp, duration, size, status, headers, content) VALUES (?,?,?,?,?,?,?,?)",
+        f"INSERT OR IGNORE INTO {schema}.snapshots(uuid, check_name, timestamp, duration, size, status, headers, content) VALUES (?,?,?,?,?,?,?,?)",
         (
             snap.uuid,
             snap.check,
@@ -208,16 +463,179 @@ def save_snapshot(conn: sqlite3.Connection, snap: Snapshot):
     )
 
 
+def uptime_permille(uptime: float) -> int:
+    """
+    Uptime ratio in integer permille, only full uptime is 1000.
+    """
+    permille = round(uptime * 1000)
+    # plain rounding would turn anything from 99.95% up into 1000
+    return permille if uptime == 1 else min(permille, 999)
+
+
+def compact_histograms(
+    data: dict, buckets: int, start: datetime, end: datetime
+) -> dict:
+    """
+    Columnar histogram payload for client side rendering.
+
+    Uptime is given in integer permille, latencies in integer milliseconds, missing
+    data as null.
+    """
+
+    def compact(values: list[float], scale) -> list[int | None]:
+        return [None if v != v else scale(v) for v in values]
+
+    return {
+        "start": start.astimezone().isoformat(),
+        "end": end.astimezone().isoformat(),
+        "buckets": buckets,
+        "hosts": {
+            host: {
+                "uptime": compact(d["hist_uptime"], uptime_permille),
+                "latency": compact(d["hist_latency"], lambda v: round(v * 1000)),
+                "latency_max": max(1, round(d["latency_geomean_max"] * 1000)),
+                "uptime_goal": d["uptime_goal"],
+            }
+            for host, d in data.items()
+        },
+    }
+
+
+def read_host_detail(
+    conn: sqlite3.Connection,
+    check: str,
+    start: datetime,
+    end: datetime,
+    interval: float,
+    max_points: int = 1500,
+) -> dict:
+    """
+    Checks of a single host in [start, end) at the finest level of detail (raw rows,
+    hourly or daily rollups) that yields at most about max_points points.
+
+    Returned as columns of bucket start time (unix seconds), uptime (permille) and
+    latency geomean and max (milliseconds).
+    """
+    span = (end - start).total_seconds()
+    for level, seconds in [("raw", interval), *ROLLUPS.items()]:
+        if span / seconds <= max_points:
+            break
+
+    if level == "raw":
+        query = """
+SELECT
+    timestamp AS bucket,
+    passed,
+    1 AS n,
+    LN(duration) AS log_duration,
+    LN(duration) IS NOT NULL AS n_duration,
+    LN(duration) AS log_duration_max
+FROM {schema}.checks
+WHERE check_name = :check AND timestamp >= :start AND timestamp < :end
+"""
+    else:
+        query = f"""
+SELECT bucket, passed, n, log_duration, n_duration, log_duration_max
+FROM {{schema}}.checks_{level}
+WHERE check_name = :check AND bucket >= :start AND bucket < :end
+"""
+    if level != "raw":
+        # include the bucket containing start
+        start = datetime.fromtimestamp(start.timestamp() // seconds * seconds)
+    params = {
+        "check": check,
+        "start": start.timestamp(),
+        "end": end.timestamp(),
+    }
+
+    # buckets of a rollup may be split over two partitions
+    sums: dict[float, list[float]] = {}
+    for period in partitions_between(main_db_path(conn), start, end):
+        schema = attach_partition(conn, period, rdonly=True)
+        for row in conn.execute(query.format(schema=schema), params):
+            acc = sums.setdefault(row["bucket"], [0, 0, 0.0, 0, None])
+            acc[0] += row["passed"]
+            acc[1] += row["n"]
+            acc[2] += coalesce(row["log_duration"], 0.0)
+            acc[3] += row["n_duration"]
+            if row["log_duration_max"] is not None:
+                acc[4] = max(coalesce(acc[4], float("-inf")), row["log_duration_max"])
+
+    data = {
+        "level": level,
+        "seconds": seconds,
+        "t": [],
+        "uptime": [],
+        "latency": [],
+        "latency_max": [],
+    }
+    for bucket, (passed, n, log_dur, n_dur, log_max) in sorted(sums.items()):
+        data["t"].append(bucket)
+        data["uptime"].append(uptime_permille(passed / n))
+        data["latency"].append(round(exp(log_dur / n_dur) * 1000) if n_dur else None)
+        data["latency_max"].append(
+            round(exp(log_max) * 1000) if log_max is not None else None
+        )
+    return data
+
+
+_SEALED_STATS: dict[tuple[str, int], list[tuple[str, int, int, float, int]]] = {}
+"""
+Cached per-check sums of sealed partitions by path and modification time, as they
+only change when a partition is reopened for late results.
+"""
+
+
 def all_time_stats(conn: sqlite3.Connection) -> dict[str, dict[str, float]]:
+    # per check: [passed, count, sum log(duration), count log(duration)]
+    sums: dict[str, list[float]] = defaultdict(lambda: [0, 0, 0.0, 0])
+    for period, path in partitions(main_db_path(conn)).items():
+        key = (path, os.stat(path).st_mtime_ns)
+        rows = _SEALED_STATS.get(key)
+        if rows is None:
+            schema = attach_partition(conn, period, rdonly=True)
+            rows = [
+                tuple(row)
+                for row in conn.execute(
+                    f"SELECT check_name, SUM(passed), COUNT(*), TOTAL(LN(duration)), COUNT(LN(duration)) FROM {schema}.checks GROUP BY check_name"
+                )
+            ]
+            if is_sealed(path):
+                _SEALED_STATS[key] = rows
+        for check, *vals in rows:
+            for i, val in enumerate(vals):
+                sums[check][i] += val
+
     return {
-        row["check_name"]: {
-            k: row[k] for k in ("total_uptime", "total_latency_geomean")
+        check: {
+            "total_uptime": passed / n,
+            "total_latency_geomean": (exp(log_dur / n_dur) if n_dur else float("nan")),
         }
-        for row in conn.execute(
-            "SELECT check_name, AVG(passed) AS total_uptime, exp(avg(log(duration))) as total_latency_geomean FROM checks GROUP BY check_name"
-        )
+        for check, (passed, n, log_dur, n_dur) in sums.items()
     }
 
 
 def incidents(conn: sqlite3.Connection) -> dict[str, Sequence[Incident]]:
     conn.execute("SELECT * FROM checks")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m upcheck.db [list | drop YYYY-MM...], stop upcheck before dropping
+    if sys.argv[1:2] == ["drop"]:
+        existing = partitions()
+        unknown = [period for period in sys.argv[2:] if period not in existing]
+        if unknown:
+            print(
+                f"No partitions for {', '.join(unknown)}, existing partitions are: {', '.join(existing) or 'none'}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        for period in sys.argv[2:]:
+            drop_partition(period)
+            print(f"dropped partition {period}")
+    else:
+        for period, path in partitions().items():
+            sealed = "sealed" if is_sealed(path) else ""
+            print(f"{period}  {os.path.getsize(path):>12}  {sealed}")
@@ -1,4 +1,15 @@
+import os
 import sqlite3
+import stat
+
+from upcheck.db import (
+    SEALED_MODE,
+    attach_partition,
+    build_rollups,
+    is_sealed,
+    main_db_path,
+    partitions,
+)
 
 def migrate_schema(name: str, new_schema: str, new_fields_calc: str, *index_decls) -> str:
     return "\n\n".join((
@@ -16,6 +27,77 @@ class Migration:
     def apply(self, conn: sqlite3.Connection):
         conn.executescript("\n".join(self.code))
 
+
+class PartitionMigration(Migration):
+    """
+    Move checks and snapshots from the main database into per-month partitions.
+    """
+
+    TABLES = {
+        "checks": "check_name, timestamp, duration, size, status, passed, errors, cert_expiry",
+        "snapshots": "uuid, check_name, timestamp, duration, size, status, headers, content",
+    }
+
+    def __init__(self):
+        super().__init__()
+
+    def apply(self, conn: sqlite3.Connection):
+        tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master")}
+        if not set(self.TABLES) <= tables:
+            # an earlier run already finished moving the data
+            return
+
+        period_of = "strftime('%Y-%m', timestamp, 'unixepoch', 'localtime')"
+        periods = [
+            period
+            for period, in conn.execute(
+                f"SELECT {period_of} FROM checks UNION SELECT {period_of} FROM snapshots"
+            ).fetchall()
+        ]
+        for period in periods:
+            schema = attach_partition(conn, period, rdonly=False)
+            for table, fields in self.TABLES.items():
+                # rows may already have been copied by an interrupted earlier run
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {schema}.{table}({fields}) SELECT {fields} FROM main.{table} WHERE {period_of} = ?",
+                    (period,),
+                )
+            conn.commit()
+
+        conn.execute("DROP TABLE main.checks")
+        conn.execute("DROP TABLE main.snapshots")
+        # VACUUM is not allowed inside a transaction, this commits the drops
+        conn.autocommit = True
+        try:
+            conn.execute("VACUUM main")
+        finally:
+            conn.autocommit = False
+
+
+class RollupMigration(Migration):
+    """
+    Build the hourly and daily rollup tables of all existing partitions.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    def apply(self, conn: sqlite3.Connection):
+        for path in partitions(main_db_path(conn)).values():
+            sealed = is_sealed(path)
+            if sealed:
+                os.chmod(path, SEALED_MODE | stat.S_IWUSR)
+            part = sqlite3.connect(path, isolation_level=None)
+            try:
+                build_rollups(part)
+                if sealed:
+                    part.execute("VACUUM")
+            finally:
+                part.close()
+                if sealed:
+                    os.chmod(path, SEALED_MODE)
+
+
 MIGRATIONS: list[Migration] = [
     Migration(
         migrate_schema(
@@ -48,19 +130,23 @@ MIGRATIONS: list[Migration] = [
             "uuid, check_name, strftime('%s', timestamp) AS timestamp, duration, size, status, headers, content",
             "CREATE INDEX snapshots_name ON snapshots (check_name, timestamp);",
         ),
-    )
+    ),
+    Migration(
+        "ALTER TABLE checks ADD COLUMN cert_expiry REAL;",
+    ),
+    PartitionMigration(),
+    RollupMigration(),
 ]
 
 def apply_migrations(conn: sqlite3.Connection):
     # get database version
     version, = conn.execute("PRAGMA user_version;").fetchone()
-    # default i to version
     for i, migration in enumerate(MIGRATIONS, start=1):
         if i > version:
             print(f"updating db to version {i}...")
             migration.apply(conn)
-
-    # cannot use parameters here, so we have to use interprolation
-    # this should be safe
-    conn.execute(f'PRAGMA user_version = {i}')
-    conn.commit()
+            # record every step, so an interrupted upgrade resumes where it stopped
+            # cannot use parameters here, so we have to use interprolation
+            # this should be safe
+            conn.execute(f"PRAGMA user_version = {i}")
+            conn.commit()
@@ -1,9 +1,10 @@
 from collections.abc import Sequence
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 import tomllib
 import json
 from typing import Any, TextIO
+from urllib.parse import urlsplit
 
 
 def _json_default(obj: Any) -> Any:
@@ -12,6 +13,22 @@ def _json_default(obj: Any) -> Any:
     return repr(obj)
 
 
+CHECK_TYPES = ("http", "tcp", "tls")
+
+DEFAULT_PORTS = {"https": 443, "tls": 443, "http": 80}
+
+
+def host_port(url: str, scheme: str) -> tuple[str, int]:
+    """
+    Host and port of a url, urls without a scheme use the given one.
+    """
+    parts = urlsplit(url if "://" in url else f"{scheme}://{url}")
+    port = parts.port or DEFAULT_PORTS.get(parts.scheme)
+    if parts.hostname is None or port is None:
+        raise ValueError(f"Cannot determine host and port from {url!r}")
+    return parts.hostname, port
+
+
 @dataclass(kw_only=True)
 class ConnCheckSpec:
     name: str
@@ -21,10 +38,34 @@ class ConnCheckSpec:
     timeout_degraded: float = 2.0
     status: Sequence[int] = (200,)
     body: str | None = None
+    type: str = "http"
+    """
+    one of `http`, `tcp` (port accepts connections) or `tls` (handshake succeeds)
+    """
+    cert_expiry_days: float = 14.0
+    """
+    tls checks fail if the certificate expires in less than this many days
+    """
+    conditional: bool = False
+    """
+    send If-None-Match/If-Modified-Since and reuse the last verdict on 304
+    """
+    range_bytes: int | None = None
+    """
+    only request (and read) the first n bytes of the body
+    """
 
     def __post_init__(self):
         if isinstance(self.status, int):
             self.status = (self.status,)
+        if self.type not in CHECK_TYPES:
+            raise ValueError(
+                f"Invalid check type {self.type!r} for {self.name}, use one of {', '.join(CHECK_TYPES)}"
+            )
+        if self.type != "http":
+            host_port(self.url, self.type)
+        if self.range_bytes is not None and self.range_bytes < 1:
+            raise ValueError(f"range_bytes of {self.name} must be at least 1")
 
     @classmethod
     def from_file(cls, file: TextIO) -> list["ConnCheckSpec"]:
@@ -53,6 +94,7 @@ class ConnCheckRes:
     status: int
     passed: bool
     errors: Sequence[str]
+    cert_expiry: datetime | None = None
 
     def json(self) -> str:
         return json.dumps(
@@ -74,9 +116,15 @@ class Config:
     port: int = 8080
     user_agent: str = "Mozilla/5.0 (compatible; upcheck-bot; +${domain})"
     interval: int = 60 * 5  # every 5 minutes
+    notify_after: int = 1  # consecutive failures before notifying
+    notifications: dict[str, dict[str, Any]] = field(default_factory=dict)
 
     def __post_init__(self):
         self.user_agent = self.user_agent.format(domain=self.domain)
+        if self.notify_after < 1:
+            raise ValueError(
+                f"notify_after must be at least 1, got {self.notify_after}"
+            )
 
     @classmethod
     def load(cls, file: str) -> "Config":
@@ -86,7 +134,12 @@ class Config:
             host: ConnCheckSpec(name=host, **check)
             for host, check in data.pop("host").items()
         }
-        return Config(location=file, checks=checks, **data["core"])
+        return Config(
+            location=file,
+            checks=checks,
+            notifications=data.pop("notify", {}),
+            **data["core"],
+        )
 
 
 @dataclass
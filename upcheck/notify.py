@@ -0,0 +1,325 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.message import EmailMessage
+import multiprocessing.queues
+import queue
+import smtplib
+import sys
+import time
+import traceback
+
+import requests
+
+from upcheck.model import Config, ConnCheckRes
+
+
+@dataclass
+class Event:
+    check: str
+    time: datetime
+    kind: str
+    """
+    either `down` or `up`
+    """
+    errors: Sequence[str] = ()
+
+    def line(self) -> str:
+        t = self.time.strftime("%Y-%m-%d %H:%M")
+        if self.kind == "up":
+            return f"{self.check} recovered at {t}"
+        return (
+            f"{self.check} down since {t}: {', '.join(self.errors) or 'check failed'}"
+        )
+
+
+class Channel(ABC):
+    """
+    Base class of all notification channels.
+
+    Subclasses implement `send` and are registered in `CHANNELS` under the name that
+    is used as `type` in the config. `send` may block and should raise on failure.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_window: float = 30.0,
+        rate_limit: int = 10,
+        rate_period: float = 60 * 60,
+        retries: int = 5,
+        backoff: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        self.name = name
+        self.batch_window = batch_window
+        """
+        seconds to wait for more events before sending a message
+        """
+        self.rate_limit = rate_limit
+        """
+        maximum number of messages per rate_period seconds
+        """
+        self.rate_period = rate_period
+        self.retries = retries
+        self.backoff = backoff
+        """
+        seconds to wait before the first retry, doubled with every retry
+        """
+        self.timeout = timeout
+        if rate_limit < 1:
+            raise ValueError(f"rate_limit of {name} must be at least 1")
+
+    @abstractmethod
+    def send(self, subject: str, body: str): ...
+
+    def redact(self, message: str) -> str:
+        """
+        Remove secrets from an error message before it is logged.
+        """
+        return message
+
+
+class EmailChannel(Channel):
+    def __init__(
+        self,
+        name: str,
+        to: str | Sequence[str],
+        sender: str,
+        host: str = "localhost",
+        port: int = 587,
+        starttls: bool = True,
+        user: str | None = None,
+        password: str | None = None,
+        **kwargs,
+    ):
+        super().__init__(name, **kwargs)
+        self.to = (to,) if isinstance(to, str) else tuple(to)
+        self.sender = sender
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+
+    def send(self, subject: str, body: str):
+        msg = EmailMessage()
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.to)
+        msg.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user is not None:
+                smtp.login(self.user, self.password or "")
+            smtp.send_message(msg)
+
+
+class NtfyChannel(Channel):
+    def __init__(self, name: str, url: str, token: str | None = None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.url = url
+        """
+        url of the topic, e.g. https://ntfy.sh/my-upcheck
+        """
+        self.token = token
+
+    def send(self, subject: str, body: str):
+        # publish as json, headers are latin-1 only and check names may be any unicode
+        server, _, topic = self.url.rstrip("/").rpartition("/")
+        headers = {}
+        if self.token is not None:
+            headers["Authorization"] = f"Bearer {self.token}"
+        requests.post(
+            server,
+            json={
+                "topic": topic,
+                "title": subject,
+                "message": body,
+                "tags": ["warning"],
+            },
+            headers=headers,
+            timeout=self.timeout,
+        ).raise_for_status()
+
+
+class TelegramChannel(Channel):
+    def __init__(
+        self,
+        name: str,
+        token: str,
+        chat_id: str | int,
+        api_url: str = "https://api.telegram.org",
+        **kwargs,
+    ):
+        super().__init__(name, **kwargs)
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url
+
+    def send(self, subject: str, body: str):
+        requests.post(
+            f"{self.api_url}/bot{self.token}/sendMessage",
+            json={"chat_id": self.chat_id, "text": f"{subject}\n\n{body}"},
+            timeout=self.timeout,
+        ).raise_for_status()
+
+    def redact(self, message: str) -> str:
+        # the token is part of the url, which requests puts into its errors
+        return message.replace(self.token, "<token>")
+
+
+CHANNELS: dict[str, type[Channel]] = {
+    "email": EmailChannel,
+    "ntfy": NtfyChannel,
+    "telegram": TelegramChannel,
+}
+
+
+def make_channels(cfg: Config) -> list[Channel]:
+    """
+    Create the configured channels, raises ValueError if the config is invalid.
+    """
+    channels = []
+    for name, settings in cfg.notifications.items():
+        settings = dict(settings)
+        kind = settings.pop("type", None)
+        if kind not in CHANNELS:
+            raise ValueError(
+                f"Invalid notification type {kind!r} for {name}, use one of {', '.join(CHANNELS)}"
+            )
+        try:
+            channels.append(CHANNELS[kind](name, **settings))
+        except TypeError as ex:
+            raise ValueError(f"Invalid settings for notification {name}: {ex}") from ex
+    return channels
+
+
+def format_message(events: Sequence[Event]) -> tuple[str, str]:
+    # the state of each check after the batch
+    latest = {e.check: e.kind for e in events}
+    down = [check for check, kind in latest.items() if kind == "down"]
+    up = [check for check, kind in latest.items() if kind == "up"]
+    if len(events) == 1:
+        subject = f"{events[0].check} {'recovered' if up else 'is down'}"
+    elif down:
+        subject = f"{len(down)} service{'s' if len(down) > 1 else ''} down"
+        if up:
+            subject += f", {len(up)} recovered"
+    else:
+        subject = f"{len(up)} services recovered"
+    return f"UpCheck: {subject}", "\n".join(e.line() for e in events)
+
+
+@dataclass
+class _ChannelState:
+    pending: list[Event] = field(default_factory=list)
+    not_before: float = 0.0
+    attempts: int = 0
+    sent: deque[float] = field(default_factory=deque)
+
+
+class Notifier:
+    """
+    Turns check results into notifications.
+
+    Consecutive failures of a check are deduplicated into one incident, which is
+    reported once when it starts and once when it ends. Events are batched per
+    channel, rate limited and retried with exponential backoff.
+    """
+
+    def __init__(self, channels: Sequence[Channel], after: int = 1):
+        self.channels = list(channels)
+        self.after = after
+        """
+        number of consecutive failures after which an incident is opened
+        """
+        self.failures: dict[str, int] = {}
+        self.states = {channel.name: _ChannelState() for channel in self.channels}
+
+    def feed(self, res: ConnCheckRes, now: float):
+        failures = self.failures.get(res.check, 0)
+        if res.passed:
+            self.failures[res.check] = 0
+            if failures >= self.after:
+                self._emit(Event(res.check, res.time, "up"), now)
+            return
+
+        self.failures[res.check] = failures + 1
+        if failures + 1 == self.after:
+            self._emit(Event(res.check, res.time, "down", tuple(res.errors)), now)
+
+    def _emit(self, event: Event, now: float):
+        for channel in self.channels:
+            state = self.states[channel.name]
+            if not state.pending:
+                state.not_before = max(state.not_before, now + channel.batch_window)
+            state.pending.append(event)
+
+    def tick(self, now: float):
+        """
+        Send all batches that are due.
+        """
+        for channel in self.channels:
+            state = self.states[channel.name]
+            if not state.pending or now < state.not_before:
+                continue
+
+            while state.sent and state.sent[0] <= now - channel.rate_period:
+                state.sent.popleft()
+            if len(state.sent) >= channel.rate_limit:
+                # keep collecting events until the oldest message leaves the window
+                state.not_before = state.sent[0] + channel.rate_period
+                continue
+
+            try:
+                channel.send(*format_message(state.pending))
+            except Exception as ex:
+                state.attempts += 1
+                if state.attempts > channel.retries:
+                    print(
+                        f"Dropping {len(state.pending)} notifications for {channel.name} after {channel.retries} retries: '{channel.redact(str(ex))}'",
+                        file=sys.stderr,
+                    )
+                    state.pending = []
+                    state.attempts = 0
+                else:
+                    print(
+                        f"Error sending notification via {channel.name}: '{channel.redact(str(ex))}'",
+                        file=sys.stderr,
+                    )
+                    state.not_before = now + channel.backoff * 2 ** (state.attempts - 1)
+                continue
+
+            state.pending = []
+            state.attempts = 0
+            state.sent.append(now)
+
+
+def notify_daemon(
+    channels: Sequence[Channel], after: int, events: multiprocessing.queues.Queue
+):
+    notifier = Notifier(channels, after)
+    while True:
+        try:
+            res = events.get(timeout=1)
+            notifier.feed(res, time.monotonic())
+        except queue.Empty:
+            pass
+        try:
+            notifier.tick(time.monotonic())
+        except Exception:
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    # send a test message via all configured channels
+    cfg = Config.load(sys.argv[-1])
+    for channel in make_channels(cfg):
+        print(f"sending test message via {channel.name}")
+        channel.send(
+            "UpCheck: Test notification", f"Notifications for {cfg.domain} work!"
+        )
@@ -0,0 +1,127 @@
+import os
+import pickle
+import sqlite3
+import sys
+import time
+from typing import Any
+
+SPOOL_PATH = "upcheck.spool.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    enqueued REAL NOT NULL,
+    payload BLOB NOT NULL
+);
+"""
+
+
+class Spool:
+    """
+    Durable queue between the check daemons and the writer, backed by SQLite.
+
+    Items stay in the spool until the consumer acknowledges them, so they survive
+    crashes and restarts of the writer. The spool runs in WAL mode with
+    synchronous=NORMAL, which fsyncs in batches on checkpoints instead of on every
+    put. Producers block while more than max_pending items are waiting.
+
+    Each process opens its own connection on first use, so a Spool can be passed to
+    child processes.
+    """
+
+    def __init__(self, path: str = SPOOL_PATH, max_pending: int = 100_000):
+        self.path = path
+        self.max_pending = max_pending
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def __getstate__(self):
+        return {"path": self.path, "max_pending": self.max_pending}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def pending(self) -> int:
+        lo, hi = (
+            self._connect().execute("SELECT MIN(id), MAX(id) FROM spool").fetchone()
+        )
+        return 0 if lo is None else hi - lo + 1
+
+    def put(self, item: Any):
+        conn = self._connect()
+        if self.pending() >= self.max_pending:
+            print(
+                f"Spool is full ({self.max_pending} items), waiting for the writer",
+                file=sys.stderr,
+            )
+            while self.pending() >= self.max_pending:
+                time.sleep(1)
+        conn.execute(
+            "INSERT INTO spool(enqueued, payload) VALUES (?, ?)",
+            (time.time(), pickle.dumps(item)),
+        )
+
+    def get(self, n: int, timeout: float) -> list[tuple[int, Any]]:
+        """
+        Return up to n of the oldest unacknowledged items as (id, item), waiting up to
+        timeout seconds for one to arrive. Items are returned again until they are
+        acknowledged, items that cannot be unpickled are dropped.
+        """
+        conn = self._connect()
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = conn.execute(
+                "SELECT id, payload FROM spool ORDER BY id LIMIT ?", (n,)
+            ).fetchall()
+            items = []
+            for id, payload in rows:
+                try:
+                    items.append((id, pickle.loads(payload)))
+                except Exception as ex:
+                    # it would be returned again forever and block everything behind it
+                    print(
+                        f"Dropping unreadable spool item {id}: '{ex}'", file=sys.stderr
+                    )
+                    conn.execute("DELETE FROM spool WHERE id = ?", (id,))
+            if items or time.monotonic() >= deadline:
+                return items
+            if not rows:
+                time.sleep(0.2)
+
+    def ack(self, ids: list[int]):
+        conn = self._connect()
+        conn.execute("BEGIN")
+        conn.executemany("DELETE FROM spool WHERE id = ?", [(id,) for id in ids])
+        conn.execute("COMMIT")
+
+    def oldest(self) -> float | None:
+        """
+        Time the oldest waiting item was put into the spool, None if it is empty.
+        """
+        row = (
+            self._connect()
+            .execute("SELECT enqueued FROM spool ORDER BY id LIMIT 1")
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def lag(self) -> dict[str, float]:
+        """
+        Number of waiting items and the age of the oldest one in seconds.
+        """
+        oldest = self.oldest()
+        return {
+            "pending": self.pending(),
+            "age": 0.0 if oldest is None else time.time() - oldest,
+        }
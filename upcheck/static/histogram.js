@@ -0,0 +1,92 @@
+// Renders the uptime and latency histograms from the compact payload embedded
+// in the page, so the server only has to ship numbers instead of markup.
+//
+// payload: {start, end, buckets, hosts: {name: {uptime: [permille|null], latency: [ms|null], latency_max: ms, uptime_goal}}}
+// uptime is only 1000 if every check in the bucket passed
+
+const COLORS = {
+  gray: '#dadddf',   // no data
+  green: '#28a745',  // good
+  orange: '#fd7e14', // warning
+  red: '#dc3545',    // critical
+};
+
+function uptimeColor(up, goal) {
+  if (up === null) return 'gray';
+  if (up === 1000) return 'green';
+  if (up < goal * 1000) return 'red';
+  return 'orange';
+}
+
+function latencyColor(lat, maxLat) {
+  if (lat === null) return 'gray';
+  if (lat > 2 * maxLat) return 'red';
+  if (lat > maxLat) return 'orange';
+  return 'green';
+}
+
+function formatTime(t) {
+  return t.toLocaleString(undefined, {dateStyle: 'short', timeStyle: 'short'});
+}
+
+function formatLatency(ms) {
+  if (ms === null) return 'No Data';
+  if (ms >= 1000) return `${(ms / 1000).toFixed(2)}s`;
+  return `${ms}ms`;
+}
+
+// values: per bucket {size: 0..1, color}, bars grow from the top if data-align=top
+function drawBars(canvas, values) {
+  const ratio = window.devicePixelRatio || 1;
+  const width = canvas.clientWidth * ratio;
+  const height = canvas.clientHeight * ratio;
+  canvas.width = width;
+  canvas.height = height;
+
+  const ctx = canvas.getContext('2d');
+  const top = canvas.dataset.align === 'top';
+  const gap = (window.innerWidth > 800 && values.length <= 200 ? 3 : 0) * ratio;
+  const barWidth = (width - gap * (values.length - 1)) / values.length;
+
+  values.forEach(({size, color}, i) => {
+    const h = (color === 'gray' ? 1 : Math.max(0, Math.min(size, 1))) * height;
+    ctx.fillStyle = COLORS[color];
+    ctx.beginPath();
+    ctx.roundRect(i * (barWidth + gap), top ? 0 : height - h, Math.max(barWidth, 1), h, gap ? ratio * 3 : 0);
+    ctx.fill();
+  });
+}
+
+function renderHistograms(payload) {
+  const start = new Date(payload.start).getTime();
+  const bucketWidth = (new Date(payload.end).getTime() - start) / payload.buckets;
+
+  document.querySelectorAll('canvas.histogram[data-host]').forEach(canvas => {
+    const host = payload.hosts[canvas.dataset.host];
+    const kind = canvas.dataset.kind;
+    const series = host[kind];
+
+    const values = series.map(v => kind === 'uptime'
+      ? {size: v / 1000, color: uptimeColor(v, host.uptime_goal)}
+      : {size: v / host.latency_max, color: latencyColor(v, host.latency_max)});
+    drawBars(canvas, values);
+
+    canvas.onmousemove = e => {
+      const rect = canvas.getBoundingClientRect();
+      const i = Math.floor((e.clientX - rect.left) / rect.width * series.length);
+      if (i < 0 || i >= series.length) return;
+      const v = series[i];
+      const label = kind === 'uptime'
+        ? (v === null ? 'No Data' : `${Math.round(v / 10)}%`)
+        : formatLatency(v);
+      canvas.title = `${formatTime(new Date(start + i * bucketWidth))}: ${label}`;
+    };
+  });
+}
+
+const histogramData = document.getElementById('histogram-data');
+if (histogramData) {
+  const payload = JSON.parse(histogramData.textContent);
+  renderHistograms(payload);
+  window.addEventListener('resize', () => renderHistograms(payload));
+}
@@ -0,0 +1,126 @@
+// Zoomable uptime and latency view of a single host. Scroll to zoom, drag to
+// pan, double click to reset. The server picks the level of detail (raw checks,
+// hourly or daily rollups) for the visible range, see read_host_detail.
+//
+// requires histogram.js for the colors and formatting helpers
+
+const root = document.getElementById('host-view');
+const host = root.dataset.host;
+const goal = parseFloat(root.dataset.uptimeGoal);
+const degraded = parseFloat(root.dataset.latencyDegraded) * 1000;
+const minSpan = parseFloat(root.dataset.interval) * 1000 * 10;
+const maxSpan = 10 * 365 * 24 * 60 * 60 * 1000;
+
+const initial = {end: Date.now(), span: 24 * 60 * 60 * 1000};
+let view = {...initial};
+let data = null;
+let pending = null;
+
+// place each point at its own time, bars are as wide as the bucket they cover
+function drawSeries(canvas, values, t, seconds) {
+  const ratio = window.devicePixelRatio || 1;
+  const width = canvas.width = canvas.clientWidth * ratio;
+  const height = canvas.height = canvas.clientHeight * ratio;
+  const ctx = canvas.getContext('2d');
+  const top = canvas.dataset.align === 'top';
+  const start = view.end - view.span;
+  const barWidth = Math.max(seconds * 1000 / view.span * width, ratio);
+
+  ctx.fillStyle = COLORS.gray;
+  ctx.fillRect(0, 0, width, height);
+  values.forEach(({size, color}, i) => {
+    const x = (t[i] * 1000 - start) / view.span * width;
+    const h = Math.max(0, Math.min(size, 1)) * height;
+    ctx.fillStyle = COLORS[color];
+    ctx.fillRect(x, top ? 0 : height - h, barWidth, h);
+  });
+}
+
+function render() {
+  document.getElementById('range-start').textContent = formatTime(new Date(view.end - view.span));
+  document.getElementById('range-end').textContent = formatTime(new Date(view.end));
+  if (!data) return;
+  document.getElementById('level').textContent = data.level;
+
+  const maxLat = Math.max(degraded, ...data.latency_max.filter(v => v !== null));
+  drawSeries(
+    document.getElementById('uptime'),
+    data.uptime.map(v => ({size: v / 1000, color: uptimeColor(v, goal)})),
+    data.t, data.seconds,
+  );
+  drawSeries(
+    document.getElementById('latency'),
+    data.latency.map(v => ({size: v / maxLat, color: latencyColor(v, degraded)})),
+    data.t, data.seconds,
+  );
+}
+
+async function load() {
+  const query = new URLSearchParams({
+    start: (view.end - view.span) / 1000,
+    end: view.end / 1000,
+  });
+  const ctrl = new AbortController();
+  if (pending) pending.abort();
+  pending = ctrl;
+  try {
+    const res = await fetch(`/api/host/${encodeURIComponent(host)}?${query}`, {signal: ctrl.signal});
+    data = await res.json();
+    document.getElementById('query-time').textContent = formatLatency(Math.round(data.time * 1000));
+    render();
+  } catch (e) {
+    if (e.name !== 'AbortError') throw e;
+  }
+}
+
+function setView(end, span) {
+  span = Math.max(minSpan, Math.min(span, maxSpan));
+  view = {end: Math.min(end, Date.now()), span};
+  render();
+  load();
+}
+
+document.querySelectorAll('#host-view canvas').forEach(canvas => {
+  canvas.addEventListener('wheel', e => {
+    e.preventDefault();
+    const rect = canvas.getBoundingClientRect();
+    const frac = (e.clientX - rect.left) / rect.width;
+    const cursor = view.end - view.span * (1 - frac);
+    const span = view.span * Math.exp(e.deltaY / 500);
+    // keep the time under the cursor in place
+    setView(cursor + span * (1 - frac), span);
+  }, {passive: false});
+
+  let drag = null;
+  canvas.addEventListener('pointerdown', e => {
+    drag = {x: e.clientX, end: view.end};
+    canvas.setPointerCapture(e.pointerId);
+  });
+  canvas.addEventListener('pointermove', e => {
+    if (!drag) return;
+    const dx = (e.clientX - drag.x) / canvas.getBoundingClientRect().width;
+    setView(drag.end - dx * view.span, view.span);
+  });
+  canvas.addEventListener('pointerup', () => drag = null);
+  canvas.addEventListener('dblclick', () => setView(initial.end, initial.span));
+
+  canvas.addEventListener('mousemove', e => {
+    if (!data || !data.t.length) return;
+    const rect = canvas.getBoundingClientRect();
+    const t = (view.end - view.span * (1 - (e.clientX - rect.left) / rect.width)) / 1000;
+    // last point starting before the cursor
+    let i = data.t.findIndex(b => b > t) - 1;
+    if (i === -2) i = data.t.length - 1;
+    if (i < 0 || t - data.t[i] > data.seconds) {
+      canvas.title = '';
+      return;
+    }
+    const label = canvas.id === 'uptime'
+      ? `${Math.round(data.uptime[i] / 10)}%`
+      : `${formatLatency(data.latency[i])} (max ${formatLatency(data.latency_max[i])})`;
+    canvas.title = `${formatTime(new Date(data.t[i] * 1000))}: ${label}`;
+  });
+});
+
+window.addEventListener('resize', render);
+setView(initial.end, initial.span);
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from math import ceil
+from math import ceil, isfinite
 import os
 import time
 import flask
@@ -8,12 +8,15 @@ from upcheck.cache import timed_cache
 from upcheck.migrations import apply_migrations
 from upcheck.model import Config
 from upcheck.db import (
+    compact_histograms,
     read_histogram_new,
+    read_host_detail,
     with_conn,
     initialize_db,
     all_time_stats,
 )
 from upcheck.daemon import spawn_daemons
+from upcheck.spool import Spool
 
 config = Config.load("upcheck.toml")
 
@@ -32,35 +35,15 @@ with with_conn() as conn:
 # start background processes
 spawn_daemons(config)
 
+spool = Spool()
+
 app = flask.Flask(__name__)
 app.secret_key = config.secret
-app.jinja_env.filters["zip"] = zip
-
-
-@app.context_processor
-def inject_ctx():
-    def lat_to_color(lat, max_lat):
-        if lat != lat:
-            return "gray"
-        if lat > 2 * max_lat:
-            return "red"
-        if lat > max_lat:
-            return "orange"
-        return "green"
-
-    def uptime_to_color(up, goal):
-        if up != up:
-            return "gray"
-        if up == 1:
-            return "green"
-        if up < goal:
-            return "red"
-        return "orange"
-
-    return {
-        "lat_to_color": lat_to_color,
-        "uptime_to_color": uptime_to_color,
-    }
+# keep the embedded histogram payload small
+app.jinja_env.policies["json.dumps_kwargs"] = {
+    "sort_keys": True,
+    "separators": (",", ":"),
+}
 
 
 app.jinja_env.filters["duration"] = aalib.duration.duration
@@ -113,6 +96,9 @@ def load_template_data(buckets: int, duration: timedelta, end: datetime):
     return data2
 
 
+MAX_BUCKETS = 24 * 60
+
+
 @app.route("/")
 def index():
     t0 = time.time()
@@ -121,7 +107,7 @@ def index():
         "duration", timedelta(days=1), type=parse_duration
     )
     end = flask.request.args.get("end", datetime.now(), datetime.fromisoformat)
-    buckets = max(min(buckets, 24 * 4), 0)
+    buckets = max(min(buckets, MAX_BUCKETS), 1)
 
     # align to 5 minute intervals
     alignment = 5 * 60
@@ -131,12 +117,8 @@ def index():
 
     end = (end + timedelta(seconds=roundup)).replace(microsecond=0)
 
-    time_buckets = [
-        (end - (duration * (i + 1) / buckets)).astimezone()
-        for i in range(buckets - 1, -1, -1)
-    ]
-
     data = load_template_data(buckets, duration, end)
+    lag = spool.lag()
     dur = time.time() - t0
 
     if flask.request.accept_mimetypes.accept_html and not "json" in flask.request.args:
@@ -146,8 +128,10 @@ def index():
             start_time=(end - duration).astimezone(),
             end_time=end.astimezone(),
             duration=duration,
-            time_buckets=time_buckets,
+            histograms=compact_histograms(data, buckets, end - duration, end),
             buckets=buckets,
+            max_buckets=MAX_BUCKETS,
+            lag=lag,
             time=dur,
         )
     else:
@@ -158,10 +142,41 @@ def index():
                 duration=duration.total_seconds(),
                 buckets=buckets,
                 hosts=data,
+                lag=lag,
                 time=dur,
             )
         )
 
+
+@app.route("/host/<name>")
+def host(name: str):
+    if name not in config.checks:
+        flask.abort(404)
+    return flask.render_template(
+        "host.html", name=name, check=config.checks[name], interval=config.interval
+    )
+
+
+@app.route("/api/host/<name>")
+def host_api(name: str):
+    if name not in config.checks:
+        flask.abort(404)
+    t0 = time.time()
+    end = flask.request.args.get("end", time.time(), type=float)
+    start = flask.request.args.get("start", end - 24 * 60 * 60, type=float)
+    if not (isfinite(start) and isfinite(end) and 0 <= start < end):
+        flask.abort(400)
+    try:
+        start_time = datetime.fromtimestamp(start)
+        end_time = datetime.fromtimestamp(end)
+    except (OverflowError, ValueError, OSError):
+        flask.abort(400)
+
+    with with_conn(rdonly=True) as conn:
+        data = read_host_detail(conn, name, start_time, end_time, config.interval)
+    return flask.jsonify(**data, time=time.time() - t0)
+
+
 @app.route('/favicon.svg')
 def favicon():
     return flask.send_from_directory(os.path.join(app.root_path, 'static'), 'favicon.svg', mimetype='image/svg+xml')